@@ -0,0 +1,292 @@
+"""
+Benchmarks every Louvain/Leiden variant in the repo on the same graphs.
+
+Each (variant, graph) run happens in a fresh process so that its peak memory is its own and a run that
+takes too long can be killed. Drawing and progress output are switched off. The results are written as a
+JSON list with one record per run.
+
+Usage:
+    python benchmark.py --graphs karate stackoverflow synthetic-1000 --timeout 60 --output benchmark.json
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import time
+import warnings
+
+import numpy as np
+
+# variant: (module, entry point, local-moving routine counted as one level, input graph type)
+VARIANTS = {
+    "louvain": ("louvain", "Louvain", "move_nodes", "csr"),
+    "louvain_degree_partition": ("louvain_degree_partition", "Louvain", "move_nodes", "csr"),
+    "leiden": ("leiden", "leiden_algorithm", None, "nx"),
+    "leiden2": ("leiden2", "Leiden", "move_nodes_fast", "csr"),
+    "leiden_final": ("leiden_final", "leiden_algorithm", "first_phase", "nx"),
+    "leiden_miles": ("leiden_miles", "leiden_algorithm", "move_nodes_fast", "nx"),
+    "leiden_muya": ("leiden_muya", "Leiden", "move_nodes_fast", "nx"),
+    "leiden_degree_partition": ("leiden_degree_partition", "leiden_algorithm", "first_phase", "nx"),
+}
+
+# Variants that report their passes of local moving and phase timings to an observer.ProfileObserver
+OBSERVED = ("louvain", "louvain_degree_partition", "leiden2")
+
+DEFAULT_GRAPHS = ["karate", "stackoverflow", "synthetic-250", "synthetic-1000", "synthetic-4000", "synthetic-16000"]
+
+
+def load_graph(name, kind="csr", seed=0):
+    """
+    Builds a benchmark graph in the one representation a variant takes, so that a run's peak memory does not
+    include a copy it never reads.
+
+    Args:
+        name (str): "karate", "stackoverflow" or "synthetic-N", a planted partition graph of N nodes in
+            communities of 25 with about 6 internal and 2 external edges per node.
+        kind (str): "csr" for a CSRGraph, "nx" for a networkx graph whose nodes are the CSRGraph's labels.
+        seed (int): Seed of the synthetic graphs.
+
+    Returns:
+        CSRGraph or nx.Graph: The graph.
+    """
+    from csr_graph import CSRGraph
+
+    if name == "karate":
+        import networkx as nx
+
+        nxg = nx.karate_club_graph()
+        return CSRGraph.from_networkx(nxg) if kind == "csr" else nxg
+    if name == "stackoverflow":
+        from graph_data import GraphData
+
+        csr = GraphData().graph
+        return csr if kind == "csr" else csr.to_networkx(with_labels=True)
+    if name.startswith("synthetic-"):
+        n, sources, targets = _planted_partition_edges(int(name.split("-", 1)[1]), 25, seed)
+        if kind == "csr":
+            return CSRGraph.from_edges(n, sources, targets)
+        import networkx as nx
+
+        nxg = nx.Graph()
+        nxg.add_nodes_from(range(n))
+        nxg.add_edges_from(zip(sources.tolist(), targets.tolist()))
+        return nxg
+    raise ValueError(f"unknown graph {name!r}")
+
+
+def _planted_partition_edges(n, size, seed):
+    """
+    Samples a planted partition graph of n // size groups of size nodes, where two nodes of a group are
+    joined with probability 6 / (size - 1) and two nodes of different groups with probability 2 / n.
+
+    Returns:
+        tuple: (nodes, sources, targets), the number of nodes and the two ends of every edge.
+    """
+    rng = np.random.default_rng(seed)
+    groups = max(n // size, 1)
+    nodes = groups * size
+    p_in, p_out = 6 / (size - 1), 2 / n
+
+    # Every pair within a group independently
+    u, v = np.triu_indices(size, 1)
+    keep = rng.random((groups, len(u))) < p_in
+    group, pair = np.nonzero(keep)
+    sources = [group * size + u[pair]]
+    targets = [group * size + v[pair]]
+
+    # The number of edges between groups, then that many distinct pairs of nodes in different groups
+    between = nodes * (nodes - 1) // 2 - groups * (size * (size - 1) // 2)
+    m = rng.binomial(between, p_out) if between > 0 else 0
+    found = np.empty(0, dtype=np.int64)
+    while len(found) < m:
+        a = rng.integers(0, nodes, 2 * (m - len(found)))
+        b = rng.integers(0, nodes, len(a))
+        a, b = np.minimum(a, b), np.maximum(a, b)
+        found = np.unique(np.concatenate([found, (a * nodes + b)[a // size != b // size]]))
+    found = rng.permutation(found)[:m]
+    sources.append(found // nodes)
+    targets.append(found % nodes)
+    return nodes, np.concatenate(sources), np.concatenate(targets)
+
+
+def _membership(result, labels):
+    """
+    Reads a node -> community assignment of the original nodes out of an entry point's result.
+
+    Returns:
+        tuple: (membership, n_communities). membership is None when the result does not say which original
+            node went where.
+    """
+    from hierarchy import Hierarchy
+
+    if isinstance(result, Hierarchy):
+        membership = result.resolve().astype(np.int64)
+        return membership, result.n_communities()
+    index = {label: i for i, label in enumerate(labels)}
+    if isinstance(result, dict):
+        _, membership = np.unique([result[label] for label in labels], return_inverse=True)
+        return membership.astype(np.int64), int(membership.max(initial=-1)) + 1
+    communities = list(result)
+    if communities and all(isinstance(C, (set, frozenset, list, tuple)) for C in communities):
+        membership = np.full(len(labels), -1, dtype=np.int64)
+        for c, C in enumerate(communities):
+            for v in C:
+                if v in index:
+                    membership[index[v]] = c
+        if (membership >= 0).all():
+            return membership, len(communities)
+    return None, len(communities)
+
+
+def _count_calls(module, name, counter):
+    function = getattr(module, name)
+
+    def counted(*args, **kwargs):
+        counter[0] += 1
+        return function(*args, **kwargs)
+
+    setattr(module, name, counted)
+
+
+def run_one(variant, graph, seed=0):
+    """
+    Runs one variant on one graph in the current process.
+
+    Returns:
+        dict: The benchmark record.
+    """
+    import resource
+
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    warnings.simplefilter("ignore")
+    from observer import ProfileObserver
+    from quality import partition_modularity
+
+    module_name, entry, level_function, kind = VARIANTS[variant]
+    G = load_graph(graph, kind, seed)
+    module = importlib.import_module(module_name)
+    if hasattr(module, "draw_partitioned_graph"):
+        module.draw_partitioned_graph = lambda *args, **kwargs: None
+    levels = [0]
+    if level_function is not None:
+        _count_calls(module, level_function, levels)
+    profile = ProfileObserver() if variant in OBSERVED else None
+
+    args = (G,)
+    kwargs = {}
+    if variant == "louvain":
+        args = (G, module.singleton_partition(G))
+    elif variant == "louvain_degree_partition":
+        args = (G, module.degree_partition(G))
+    if variant in ("leiden2", "leiden_muya", "leiden_miles"):
+        kwargs = {"seed": seed}
+    if variant in ("louvain", "louvain_degree_partition", "leiden2"):
+        kwargs["return_hierarchy"] = True
+    if profile is not None:
+        kwargs["observer"] = profile
+
+    random_state = np.random.get_state()
+    np.random.seed(seed)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = getattr(module, entry)(*args, **kwargs)
+    wall_time = time.perf_counter() - start
+    np.random.set_state(random_state)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # Scored on a fresh CSRGraph, as the networkx variants may have changed their input
+    csr = G if kind == "csr" else load_graph(graph, "csr", seed)
+    membership, n_communities = _membership(result, csr.labels)
+    modularity = None if membership is None else partition_modularity(csr, membership)
+    return {
+        "variant": variant,
+        "graph": graph,
+        "nodes": len(csr),
+        "edges": csr.number_of_edges(),
+        "status": "ok",
+        "wall_time": wall_time,
+        "peak_rss_mb": peak_rss_mb,
+        "levels": levels[0] if level_function is not None else None,
+        "passes": None if profile is None else profile.passes,
+        "communities": n_communities,
+        "modularity": modularity,
+        "profile": None if profile is None else profile.summary(),
+    }
+
+
+def _child(conn, variant, graph, seed):
+    try:
+        conn.send(run_one(variant, graph, seed))
+    except Exception as e:
+        conn.send({"variant": variant, "graph": graph, "status": f"error: {type(e).__name__}: {e}"})
+    conn.close()
+
+
+def run(variants, graphs, timeout=60, seed=0):
+    """
+    Runs every variant on every graph, each run in its own process.
+
+    Args:
+        variants (list): Names from VARIANTS.
+        graphs (list): Graph names understood by load_graph.
+        timeout (float): Seconds after which a run is killed and recorded as "timeout".
+        seed (int): Seed of the synthetic graphs and of np.random during the runs.
+
+    Yields:
+        dict: One record per run, with the variant, graph, its size, status, wall_time in seconds,
+            peak_rss_mb, levels, passes, communities and modularity, and for the OBSERVED variants the
+            profile summary of observer.ProfileObserver. levels is the number of calls to the variant's
+            local-moving routine and passes the number of sweeps over the nodes within them, which only the
+            OBSERVED variants report. Fields that could not be measured are None.
+    """
+    context = multiprocessing.get_context("spawn")
+    for graph in graphs:
+        for variant in variants:
+            receive, send = context.Pipe(duplex=False)
+            process = context.Process(target=_child, args=(send, variant, graph, seed))
+            process.start()
+            send.close()
+            record = None
+            if receive.poll(timeout):
+                try:
+                    record = receive.recv()
+                except EOFError:
+                    pass
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            if record is None:
+                status = "timeout" if process.exitcode is not None and process.exitcode < 0 else "crashed"
+                record = {"variant": variant, "graph": graph, "status": status}
+            for field in ("nodes", "edges", "wall_time", "peak_rss_mb", "levels", "passes", "communities",
+                          "modularity", "profile"):
+                record.setdefault(field, None)
+            yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Louvain and Leiden variants.")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--graphs", nargs="+", default=DEFAULT_GRAPHS,
+                        help="karate, stackoverflow or synthetic-N for a planted partition graph of N nodes")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    records = []
+    for record in run(args.variants, args.graphs, args.timeout, args.seed):
+        records.append(record)
+        wall_time = "-" if record["wall_time"] is None else f"{record['wall_time']:.3f}s"
+        modularity = "-" if record["modularity"] is None else f"{record['modularity']:.4f}"
+        print(f"{record['graph']:>16} {record['variant']:>24} {record['status']:>8} {wall_time:>10} "
+              f"communities={record['communities']} modularity={modularity}", flush=True)
+        with open(args.output, "w") as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+class CommunityScratch:
+    """
+    Sums the edge weights from a node to each of its neighbouring communities, for local moving.
+
+    The sums are accumulated in one sweep over the node's row into a buffer with one slot per community id,
+    which is reused from node to node. Only the slots the sweep touched are read back and cleared, so a node
+    costs O(its degree) however many communities there are.
+    """
+
+    def __init__(self, n_slots):
+        """
+        Initializes a new CommunityScratch.
+
+        Args:
+            n_slots (int): Number of community ids, e.g. len(P.community_counts).
+        """
+        self._weights = [0.0] * n_slots
+        self._seen = [False] * n_slots
+
+    def gather(self, G, membership, v):
+        """
+        Sums the weights of the edges of v per community of its neighbours, leaving out its self-loop.
+
+        Args:
+            G (CSRGraph): The graph.
+            membership (np.ndarray): Community id of every node.
+            v (int): A node id.
+
+        Returns:
+            tuple: (communities, weights), lists of the neighbouring community ids in the order they were
+                first met and the edge weight between v and each of them.
+        """
+        weights = self._weights
+        seen = self._seen
+        lo, hi = G.indptr[v], G.indptr[v + 1]
+        neighbors = G.indices[lo:hi]
+        communities = []
+        for u, c, w in zip(neighbors.tolist(), membership[neighbors].tolist(), G.weights[lo:hi].tolist()):
+            if u == v:
+                continue
+            if not seen[c]:
+                seen[c] = True
+                communities.append(c)
+            weights[c] += w
+        sums = []
+        for c in communities:
+            sums.append(weights[c])
+            weights[c] = 0.0
+            seen[c] = False
+        return communities, sums
@@ -0,0 +1,85 @@
+import time
+
+
+class Convergence:
+    """
+    Stopping rules for Louvain and Leiden, for a predictable running time on large graphs.
+
+    A pass is one sweep of local moving over the nodes of a level; for the queue-based fast local moving it is
+    as many node visits as the level has nodes. A level is one round of local moving, after which the graph
+    is aggregated. Every move improves the quality, so stopping at any point leaves the best partition found
+    so far.
+
+    Attributes:
+        tolerance (float): Stop local moving after a pass that improved the quality by at most this fraction
+            of its absolute value.
+        max_passes (int or None): Most passes of local moving per level.
+        max_levels (int or None): Most levels.
+        time_limit (float or None): Seconds after start() at which to stop, returning the partition found.
+        deadline (float or None): The time.perf_counter() value at which the time limit runs out.
+    """
+
+    def __init__(self, tolerance=0.0, max_passes=None, max_levels=None, time_limit=None):
+        """
+        Initializes a new Convergence. The defaults never stop a run early.
+
+        Args:
+            tolerance (float): Minimum relative quality improvement of a pass.
+            max_passes (int, optional): Most passes of local moving per level.
+            max_levels (int, optional): Most levels.
+            time_limit (float, optional): Wall-clock budget in seconds, counted from start().
+        """
+        self.tolerance = tolerance
+        self.max_passes = max_passes
+        self.max_levels = max_levels
+        self.time_limit = time_limit
+        self.deadline = None
+
+    def start(self):
+        """
+        Starts the clock of the time limit.
+
+        Returns:
+            Convergence: self.
+        """
+        self.deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        return self
+
+    def expired(self):
+        """
+        Returns:
+            bool: Whether the time limit has run out.
+        """
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def stop_pass(self, passes, gain, quality):
+        """
+        Decides whether local moving stops after a pass.
+
+        Args:
+            passes (int): Number of passes done at this level, including this one.
+            gain (float): The quality improvement of this pass.
+            quality (float): The quality before this pass. Only used with a tolerance.
+
+        Returns:
+            bool: True to stop.
+        """
+        if self.max_passes is not None and passes >= self.max_passes:
+            return True
+        if self.tolerance > 0 and gain <= self.tolerance * abs(quality):
+            return True
+        return self.expired()
+
+    def stop_level(self, levels):
+        """
+        Decides whether to stop instead of aggregating for another level.
+
+        Args:
+            levels (int): Number of levels done, including this one.
+
+        Returns:
+            bool: True to stop.
+        """
+        if self.max_levels is not None and levels >= self.max_levels:
+            return True
+        return self.expired()
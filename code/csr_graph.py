@@ -0,0 +1,335 @@
+import numpy as np
+
+
+class CSRGraph:
+    """
+    An undirected graph stored in compressed sparse row (CSR) form.
+
+    Node ids are the contiguous integers 0..n-1. The neighbours of node v are
+    indices[indptr[v]:indptr[v + 1]] with the matching edge weights in
+    weights[indptr[v]:indptr[v + 1]]. Every edge (u, v) with u != v is stored
+    in both rows; a self-loop is stored once, in its own row.
+
+    Attributes:
+        indptr (np.ndarray): int64 row offsets, length n + 1.
+        indices (np.ndarray): int32 neighbour ids, length indptr[-1].
+        weights (np.ndarray): Floating point edge weights parallel to indices.
+        node_weights (np.ndarray): float64 node sizes, 1 for every node of an original graph.
+        strengths (np.ndarray): float64 weighted degree of every node, counting self-loops twice.
+        total_weight (float): Total edge weight m, half the sum of the strengths.
+        labels (sequence): The original node label of every node id.
+    """
+
+    def __init__(self, indptr, indices, weights=None, node_weights=None, labels=None):
+        """
+        Initializes a new CSRGraph from already built arrays. Arrays of the right dtype, including memory-mapped
+        ones, are used as given, not copied.
+
+        Args:
+            indptr (np.ndarray): Row offsets, length n + 1.
+            indices (np.ndarray): Neighbour ids.
+            weights (np.ndarray, optional): Edge weights. Defaults to 1 for every edge.
+            node_weights (np.ndarray, optional): Node sizes. Defaults to 1 for every node.
+            labels (list, optional): Node labels. Defaults to the node ids themselves.
+        """
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        n = len(self.indptr) - 1
+        if weights is None:
+            weights = np.ones(len(self.indices), dtype=np.float64)
+        if node_weights is None:
+            node_weights = np.ones(n, dtype=np.float64)
+        weights = np.asarray(weights)
+        self.weights = weights if np.issubdtype(weights.dtype, np.floating) else weights.astype(np.float64)
+        self.node_weights = np.asarray(node_weights, dtype=np.float64)
+        self.labels = range(n) if labels is None else labels
+
+        self.strengths = np.zeros(n, dtype=np.float64)
+        for sources, targets, w in self.edge_chunks():
+            loop_weights = np.where(sources == targets, 2 * w, w)
+            self.strengths += np.bincount(sources, weights=loop_weights, minlength=n)
+        self.total_weight = float(self.strengths.sum()) / 2
+
+    @classmethod
+    def from_edges(cls, n, sources, targets, weights=None, node_weights=None, labels=None):
+        """
+        Builds a CSRGraph from an undirected edge list. Each (source, target) pair is one edge; repeated
+        pairs, in either orientation, are merged by summing their weights.
+
+        Args:
+            n (int): Number of nodes.
+            sources (array-like): Source node id of every edge.
+            targets (array-like): Target node id of every edge.
+            weights (array-like, optional): Weight of every edge. Defaults to 1.
+            node_weights (array-like, optional): Node sizes. Defaults to 1.
+            labels (list, optional): Node labels. Defaults to the node ids.
+
+        Returns:
+            CSRGraph: The graph.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if weights is None:
+            weights = np.ones(len(sources), dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        # Store every non-loop edge in both directions and every self-loop once
+        not_loop = sources != targets
+        rows = np.concatenate([sources, targets[not_loop]])
+        cols = np.concatenate([targets, sources[not_loop]])
+        vals = np.concatenate([weights, weights[not_loop]])
+
+        order = np.lexsort((cols, rows))
+        rows, cols, vals = rows[order], cols[order], vals[order]
+        if len(rows):
+            first = np.empty(len(rows), dtype=bool)
+            first[0] = True
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            vals = np.add.reduceat(vals, np.flatnonzero(first))
+            rows, cols = rows[first], cols[first]
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(indptr, cols.astype(np.int32), vals, node_weights, labels)
+
+    @classmethod
+    def from_networkx(cls, G, weight="weight"):
+        """
+        Converts an undirected networkx graph, reading its adjacency once straight into the CSR arrays.
+
+        Args:
+            G (nx.Graph): The graph to convert.
+            weight (str): Edge attribute holding the weight. Edges without it get weight 1.
+
+        Returns:
+            CSRGraph: The graph, with the networkx nodes as labels.
+        """
+        if G.is_directed() or G.is_multigraph():
+            raise ValueError("CSRGraph only supports simple undirected graphs")
+        labels = list(G)
+        index = {node: i for i, node in enumerate(labels)}
+        adj = G.adj
+        n = len(labels)
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(adj[u]) for u in labels), dtype=np.int64, count=n), out=indptr[1:])
+        nnz = int(indptr[-1])
+        indices = np.fromiter((index[v] for u in labels for v in adj[u]), dtype=np.int32, count=nnz)
+        weights = np.fromiter(
+            (d.get(weight, 1) for u in labels for d in adj[u].values()), dtype=np.float64, count=nnz
+        )
+        return cls(indptr, indices, weights, labels=labels)
+
+    @classmethod
+    def from_graph_data(cls, data):
+        """
+        Returns the graph of a GraphData instance, which is already built in CSR form.
+
+        Args:
+            data (GraphData): The loaded StackOverflow data.
+
+        Returns:
+            CSRGraph: The tag graph, weighted by the links "value" column.
+        """
+        return data.graph
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __repr__(self):
+        return f"CSRGraph(n={len(self)}, nnz={len(self.indices)})"
+
+    @property
+    def nodes(self):
+        """
+        The node ids, as a range so that len() and membership tests are O(1).
+        """
+        return range(len(self))
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def number_of_edges(self):
+        """
+        Returns:
+            int: The number of undirected edges, counting each self-loop once.
+        """
+        loops = sum(np.count_nonzero(sources == targets) for sources, targets, _ in self.edge_chunks())
+        return (len(self.indices) + loops) // 2
+
+    def neighbors(self, v):
+        """
+        Args:
+            v (int): A node id.
+
+        Returns:
+            np.ndarray: A view of the neighbour ids of v.
+        """
+        return self.indices[self.indptr[v]:self.indptr[v + 1]]
+
+    def neighbor_weights(self, v):
+        """
+        Args:
+            v (int): A node id.
+
+        Returns:
+            np.ndarray: A view of the weights of the edges of v, parallel to neighbors(v).
+        """
+        return self.weights[self.indptr[v]:self.indptr[v + 1]]
+
+    def degree(self, v):
+        return int(self.indptr[v + 1] - self.indptr[v])
+
+    def checksum(self):
+        """
+        A fingerprint of the structure of the graph: its size, edges, edge weights and node weights, read in
+        blocks so that memory-mapped graphs are not loaded whole. Labels are not included.
+
+        Returns:
+            str: The SHA-256 hex digest.
+        """
+        import hashlib
+
+        digest = hashlib.sha256()
+        digest.update(np.array([len(self), len(self.indices)], dtype="<i8").tobytes())
+        for array, dtype in ((self.indptr, "<i8"), (self.indices, "<i4"), (self.weights, "<f8"), (self.node_weights, "<f8")):
+            for lo in range(0, len(array), 1 << 22):
+                digest.update(np.ascontiguousarray(array[lo:lo + (1 << 22)], dtype=dtype).tobytes())
+        return digest.hexdigest()
+
+    def edge_chunks(self, chunk_size=1 << 22):
+        """
+        Yields the stored adjacency entries in blocks of whole rows of about chunk_size entries, so that a pass
+        over a memory-mapped graph only holds one block in RAM at a time.
+
+        Args:
+            chunk_size (int): Target number of entries per block.
+
+        Yields:
+            tuple: (sources, targets, weights) arrays of one block.
+        """
+        n = len(self)
+        start = 0
+        while start < n:
+            stop = int(np.searchsorted(self.indptr, self.indptr[start] + chunk_size, side="right")) - 1
+            stop = min(max(stop, start + 1), n)
+            lo, hi = self.indptr[start], self.indptr[stop]
+            sources = np.repeat(np.arange(start, stop, dtype=np.int32), np.diff(self.indptr[start:stop + 1]))
+            yield sources, np.asarray(self.indices[lo:hi]), np.asarray(self.weights[lo:hi])
+            start = stop
+
+    def edges(self):
+        """
+        Yields every undirected edge once, as (u, v) with u <= v.
+        """
+        for sources, targets, _ in self.edge_chunks():
+            keep = sources <= targets
+            yield from zip(sources[keep].tolist(), targets[keep].tolist())
+
+    def aggregate(self, membership, n_communities=None):
+        """
+        Builds the community graph in one pass over the edges. Edges between two communities are summed into
+        one weighted edge, the weight inside a community becomes a self-loop and node weights are summed, so
+        qualities evaluated on the aggregate graph equal those of the partition on this graph.
+
+        Args:
+            membership (np.ndarray): Community id of every node, in 0..n_communities - 1.
+            n_communities (int, optional): Number of communities. Defaults to membership.max() + 1.
+
+        Returns:
+            CSRGraph: The aggregate graph, with one node per community.
+        """
+        membership = np.asarray(membership, dtype=np.int64)
+        if n_communities is None:
+            n_communities = int(membership.max(initial=-1)) + 1
+        keys = []
+        sums = []
+        for sources, targets, weights in self.edge_chunks():
+            # Each undirected edge once, so the intra-community weight is not doubled
+            once = sources <= targets
+            cs = membership[sources[once]]
+            ct = membership[targets[once]]
+            key, inverse = np.unique(np.minimum(cs, ct) * n_communities + np.maximum(cs, ct), return_inverse=True)
+            keys.append(key)
+            sums.append(np.bincount(inverse, weights=weights[once], minlength=len(key)))
+        key = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+        total = np.concatenate(sums) if sums else np.zeros(0)
+        node_weights = np.bincount(membership, weights=self.node_weights, minlength=n_communities)
+        return CSRGraph.from_edges(n_communities, key // n_communities, key % n_communities, total, node_weights)
+
+    def update_edges(self, sources=(), targets=(), weights=None, removed_sources=(), removed_targets=(), labels=None):
+        """
+        Applies a batch of edge insertions and deletions in place. The deletions are applied first: each
+        removes the edge between its two nodes, whatever its weight. Inserted edges are then added like in
+        from_edges, summing their weight into an existing edge between the same nodes. Inserting an edge to a
+        node id >= n adds nodes up to that id, of node weight 1.
+
+        The arrays are rebuilt in one vectorised pass over the edges, and memory-mapped arrays are replaced
+        by in-memory ones.
+
+        Args:
+            sources (array-like): Source node id of every inserted edge.
+            targets (array-like): Target node id of every inserted edge.
+            weights (array-like, optional): Weight of every inserted edge. Defaults to 1.
+            removed_sources (array-like): Source node id of every deleted edge.
+            removed_targets (array-like): Target node id of every deleted edge.
+            labels (list, optional): Labels of the added nodes. Defaults to their ids.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if weights is None:
+            weights = np.ones(len(sources), dtype=np.float64)
+        removed_sources = np.asarray(removed_sources, dtype=np.int64)
+        removed_targets = np.asarray(removed_targets, dtype=np.int64)
+        n_old = len(self)
+        n = max(n_old, int(sources.max(initial=-1)) + 1, int(targets.max(initial=-1)) + 1)
+
+        # Every existing edge once, as in edges()
+        rows = np.repeat(np.arange(n_old, dtype=np.int64), np.diff(self.indptr))
+        cols = np.asarray(self.indices, dtype=np.int64)
+        once = rows <= cols
+        rows, cols, vals = rows[once], cols[once], np.asarray(self.weights)[once]
+        if len(removed_sources):
+            removed = np.minimum(removed_sources, removed_targets) * n + np.maximum(removed_sources, removed_targets)
+            keep = ~np.isin(rows * n + cols, removed)
+            rows, cols, vals = rows[keep], cols[keep], vals[keep]
+
+        node_weights = self.node_weights
+        if n > n_old:
+            node_weights = np.concatenate([node_weights, np.ones(n - n_old)])
+            if isinstance(self.labels, range) and labels is None:
+                self.labels = range(n)
+            else:
+                self.labels = list(self.labels) + (list(labels) if labels is not None else list(range(n_old, n)))
+        G = CSRGraph.from_edges(
+            n,
+            np.concatenate([rows, sources]),
+            np.concatenate([cols, targets]),
+            np.concatenate([vals, np.asarray(weights, dtype=np.float64)]),
+            node_weights,
+        )
+        self.indptr, self.indices, self.weights = G.indptr, G.indices, G.weights
+        self.node_weights, self.strengths, self.total_weight = G.node_weights, G.strengths, G.total_weight
+
+    def to_networkx(self, with_labels=False):
+        """
+        Converts back to a networkx graph, mostly for drawing.
+
+        Args:
+            with_labels (bool): Use the node labels instead of the node ids as networkx nodes.
+
+        Returns:
+            nx.Graph: The graph with a 'weight' attribute on every edge.
+        """
+        import networkx as nx
+
+        names = self.labels if with_labels else range(len(self))
+        G = nx.Graph()
+        G.add_nodes_from(names)
+        for sources, targets, weights in self.edge_chunks():
+            keep = sources <= targets
+            G.add_weighted_edges_from(
+                (names[u], names[v], w)
+                for u, v, w in zip(sources[keep].tolist(), targets[keep].tolist(), weights[keep].tolist())
+            )
+        return G
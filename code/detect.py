@@ -0,0 +1,97 @@
+"""
+Detects the communities of a graph from the command line and writes one line per node.
+
+Only NumPy and the modules of the chosen algorithm are imported; pandas is imported when an edge list .csv is
+read, and networkx only for the named benchmark graphs. This keeps start-up short for batch jobs that run
+it once per graph.
+
+Usage:
+    python -m detect edges.csv --algorithm leiden --quality cpm --gamma 0.05 --seed 0 --output communities.tsv
+
+The output has a "label<TAB>community" line per node, written in blocks as it is produced, or is a
+partition file for warm starts when the path ends with .npz, see partition_file.
+"""
+import argparse
+import sys
+
+from quality import make_quality
+from sweep import load_graph
+
+ALGORITHMS = ("leiden", "louvain")
+
+
+def detect(G, algorithm="leiden", quality="cpm", gamma=None, null_model="configuration", seed=None, workers=1):
+    """
+    Runs Louvain or Leiden on G.
+
+    Args:
+        G (CSRGraph): The graph.
+        algorithm (str): "leiden" (leiden2.Leiden) or "louvain" (louvain.Louvain).
+        quality (str): The quality to optimise, see quality.make_quality.
+        gamma (float, optional): The resolution parameter.
+        null_model (str): The null model of the Reichardt-Bornholdt quality.
+        seed (int, optional): Seed of Leiden's random choices. Louvain visits the nodes in order and ignores it.
+        workers (int): Number of processes for local moving.
+
+    Returns:
+        np.ndarray: int32 community id of every node of G.
+    """
+    quality = make_quality(G, quality, gamma, null_model)
+    if algorithm == "leiden":
+        from leiden2 import Leiden
+
+        hierarchy = Leiden(G, quality=quality, seed=seed, workers=workers, return_hierarchy=True)
+    elif algorithm == "louvain":
+        from louvain import Louvain
+        from partition import Partition
+
+        hierarchy = Louvain(G, Partition.singleton(G), quality, workers=workers, return_hierarchy=True)
+    else:
+        raise ValueError(f"unknown algorithm {algorithm!r}")
+    return hierarchy.resolve()
+
+
+def write_membership(file, G, membership, block_size=1 << 16):
+    """
+    Writes a "label<TAB>community" line for every node, formatting block_size nodes at a time.
+
+    Args:
+        file (file): An open text file.
+        G (CSRGraph): The graph, whose labels name the nodes.
+        membership (np.ndarray): Community id of every node.
+        block_size (int): Nodes per write.
+    """
+    for lo in range(0, len(G), block_size):
+        hi = min(lo + block_size, len(G))
+        labels = G.labels[lo:hi]
+        file.write("".join(f"{label}\t{c}\n" for label, c in zip(labels, membership[lo:hi].tolist())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect the communities of a graph.")
+    parser.add_argument("graph", help="an edge list .csv, a graph file, or karate, stackoverflow or synthetic-N")
+    parser.add_argument("--algorithm", default="leiden", choices=ALGORITHMS)
+    parser.add_argument("--quality", default="cpm", choices=["cpm", "modularity", "rb"])
+    parser.add_argument("--gamma", type=float, help="the resolution parameter")
+    parser.add_argument("--null-model", default="configuration", choices=["configuration", "erdos_renyi"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default="-",
+                        help="where to write the communities: a text file, a .npz partition file, or - for stdout")
+    args = parser.parse_args(argv)
+
+    G = load_graph(args.graph)
+    membership = detect(G, args.algorithm, args.quality, args.gamma, args.null_model, args.seed, args.workers)
+    if args.output.endswith(".npz"):
+        from partition_file import write_partition
+
+        write_partition(args.output, G, membership)
+    elif args.output == "-":
+        write_membership(sys.stdout, G, membership)
+    else:
+        with open(args.output, "w") as f:
+            write_membership(f, G, membership)
+
+
+if __name__ == "__main__":
+    main()
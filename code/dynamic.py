@@ -0,0 +1,103 @@
+"""
+Communities of a graph that changes over time, kept up to date by the Leiden algorithm (leiden2) without
+starting again from singletons after every change.
+"""
+import numpy as np
+
+from leiden2 import aggregate_graph, move_nodes_fast, refine_partition, run_leiden
+from partition import Partition
+from quality import make_quality
+
+
+class DynamicLeiden:
+    """
+    A graph and its partition, updated together by batches of edge insertions and deletions.
+
+    An update changes the graph and the community totals in place and keeps the current membership. Local
+    moving then starts from the endpoints of the changed edges and their neighbours, and spreads only as far
+    as nodes actually move. Refinement rebuilds only the communities that those nodes belong to or moved
+    between; every other community becomes one node of the aggregate graph as it is. The remaining levels
+    of the Leiden algorithm run on that aggregate graph, which has about one node per community.
+
+    Attributes:
+        graph (CSRGraph): The graph, updated in place.
+        partition (Partition): The current partition of graph.
+    """
+
+    def __init__(self, G, membership=None, quality="cpm", gamma=None, null_model="configuration", seed=None):
+        """
+        Initializes a new DynamicLeiden.
+
+        Args:
+            G (CSRGraph): The graph. It is updated in place by update().
+            membership (array-like, optional): The current communities of G. Defaults to running Leiden.
+            quality (str or Quality): The quality to optimise, see make_quality. Given by name, it is rebuilt
+                after every update, so that the total weight of modularity follows the graph.
+            gamma (float, optional): The resolution parameter when quality is given by name.
+            null_model (str): The null model of the Reichardt-Bornholdt quality.
+            seed (int or np.random.Generator, optional): Seed of the node orders and refinement choices.
+        """
+        self.graph = G
+        self._quality = (quality, gamma, null_model)
+        self._rng = np.random.default_rng(seed)
+        if membership is None:
+            _, hierarchy, _ = run_leiden(G, Partition.singleton(G), self.quality(), self._rng)
+            membership = hierarchy.resolve()
+        self.partition = Partition(G, membership)
+
+    @property
+    def membership(self):
+        """
+        The community id of every node of the graph.
+        """
+        return self.partition.membership
+
+    def quality(self):
+        """
+        Returns:
+            Quality: The quality optimised, for the graph as it is now.
+        """
+        return make_quality(self.graph, *self._quality)
+
+    def update(self, sources=(), targets=(), weights=None, removed_sources=(), removed_targets=(), labels=None):
+        """
+        Applies a batch of edge changes, see CSRGraph.update_edges, and updates the communities.
+
+        Args:
+            sources (array-like): Source node id of every inserted edge.
+            targets (array-like): Target node id of every inserted edge.
+            weights (array-like, optional): Weight of every inserted edge. Defaults to 1.
+            removed_sources (array-like): Source node id of every deleted edge.
+            removed_targets (array-like): Target node id of every deleted edge.
+            labels (list, optional): Labels of the nodes the insertions add.
+
+        Returns:
+            np.ndarray: The new membership.
+        """
+        G = self.graph
+        P = self.partition
+        endpoints = np.unique(np.concatenate([
+            np.asarray(ends, dtype=np.int64) for ends in (sources, targets, removed_sources, removed_targets)
+        ]))
+        existing = endpoints[endpoints < len(G)]
+        strengths = G.strengths[existing]
+
+        G.update_edges(sources, targets, weights, removed_sources, removed_targets, labels)
+        P.add_nodes()
+        P.update_strengths(existing, G.strengths[existing] - strengths)
+        quality = self.quality()
+
+        affected = np.unique(np.concatenate([endpoints] + [G.neighbors(v) for v in endpoints.tolist()]))
+        before = P.membership.copy()
+        P = move_nodes_fast(G, P, quality, rng=self._rng, nodes=affected)
+        moved = np.flatnonzero(P.membership != before)
+        touched = np.unique(np.concatenate([P.membership[affected], before[moved], P.membership[moved]]))
+
+        P_refined = refine_partition(G, P, quality, self._rng, communities=touched)
+        refined = P_refined.renumbered()
+        H = aggregate_graph(G, P_refined, quality)
+        membership = np.empty(len(H), dtype=np.int32)
+        membership[refined] = P.membership
+        _, hierarchy, _ = run_leiden(H, Partition(H, membership), quality, self._rng)
+        self.partition = Partition(G, hierarchy.resolve()[refined])
+        return self.partition.membership
@@ -0,0 +1,160 @@
+import os
+
+import numpy as np
+
+from csr_graph import CSRGraph
+from graph_file import create_graph_file, open_graph
+
+
+def _intern(values, index, labels):
+    """
+    Maps a chunk of node labels to ids, giving new labels the next free ids.
+
+    Args:
+        values (pd.Series): Node labels.
+        index (dict): label -> id, extended in place.
+        labels (list): id -> label, extended in place.
+
+    Returns:
+        np.ndarray: int64 id of every value.
+    """
+    import pandas as pd
+
+    codes, uniques = pd.factorize(values)
+    ids = np.empty(len(uniques), dtype=np.int64)
+    for i, label in enumerate(uniques.tolist()):
+        if label not in index:
+            index[label] = len(labels)
+            labels.append(label)
+        ids[i] = index[label]
+    return ids[codes]
+
+
+def _read_chunks(path, source, target, weight, chunksize, index, labels):
+    import pandas as pd
+
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        sources = _intern(chunk[source], index, labels)
+        targets = _intern(chunk[target], index, labels)
+        if weight in chunk:
+            weights = chunk[weight].to_numpy(dtype=np.float64)
+        else:
+            weights = np.ones(len(chunk), dtype=np.float64)
+        yield sources, targets, weights
+
+
+def _row_blocks(indptr, block_size):
+    """
+    Splits rows into consecutive blocks holding about block_size entries each.
+    """
+    n = len(indptr) - 1
+    start = 0
+    while start < n:
+        stop = int(np.searchsorted(indptr, indptr[start] + block_size, side="right")) - 1
+        stop = min(max(stop, start + 1), n)
+        yield start, stop
+        start = stop
+
+
+def read_edge_csv(path, out_path=None, labels=None, source="source", target="target", weight="value",
+                  chunksize=1_000_000, weight_dtype=np.float64):
+    """
+    Builds a graph from an edge CSV without ever holding the whole file in memory.
+
+    The CSV is read twice in chunks of chunksize rows. The first pass interns the node labels and counts
+    the entries of every CSR row, the second scatters the edges into their rows. Rows are then sorted and
+    repeated edges, whether listed as A-B twice or as A-B and B-A, are merged by summing their weights.
+    Peak memory is the label table, the O(n) row arrays and one chunk, plus the edge arrays themselves
+    unless out_path is given, in which case they live on disk.
+
+    Args:
+        path (str): The edge CSV.
+        out_path (str, optional): Write a graph file here and return it memory-mapped. The labels are
+            saved next to it as out_path + ".labels.npy".
+        labels (list, optional): Labels to give the first ids, e.g. from a nodes file, in order.
+        source (str): Column holding the source label.
+        target (str): Column holding the target label.
+        weight (str): Column holding the edge weight. Edges get weight 1 when it is missing.
+        chunksize (int): Number of CSV rows read at a time.
+        weight_dtype (np.dtype): Edge weight type of the graph file.
+
+    Returns:
+        CSRGraph: The graph, labelled by the node labels of the CSV.
+    """
+    labels = list(labels) if labels is not None else []
+    index = {label: i for i, label in enumerate(labels)}
+
+    # Pass 1: intern labels and count the entries of every row
+    counts = np.zeros(max(len(labels), 1024), dtype=np.int64)
+    for sources, targets, _ in _read_chunks(path, source, target, weight, chunksize, index, labels):
+        if len(labels) > len(counts):
+            counts = np.concatenate([counts, np.zeros(max(len(labels), 2 * len(counts)) - len(counts), dtype=np.int64)])
+        not_loop = sources != targets
+        counts += np.bincount(np.concatenate([sources, targets[not_loop]]), minlength=len(counts))
+    n = len(labels)
+    raw_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts[:n], out=raw_indptr[1:])
+    raw_nnz = int(raw_indptr[-1])
+
+    if out_path is None:
+        indices = np.empty(raw_nnz, dtype=np.int32)
+        weights = np.empty(raw_nnz, dtype=np.float64)
+    else:
+        scratch_path = out_path + ".tmp"
+        scratch = create_graph_file(scratch_path, 0, raw_nnz, np.float64)
+        indices, weights = scratch["indices"], scratch["weights"]
+
+    # Pass 2: scatter every edge to the next free slot of its row(s)
+    fill = raw_indptr[:-1].copy()
+    for sources, targets, w in _read_chunks(path, source, target, weight, chunksize, index, labels):
+        not_loop = sources != targets
+        rows = np.concatenate([sources, targets[not_loop]])
+        cols = np.concatenate([targets, sources[not_loop]])
+        vals = np.concatenate([w, w[not_loop]])
+        order = np.argsort(rows, kind="stable")
+        rows, cols, vals = rows[order], cols[order], vals[order]
+        group_start = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        rank = np.arange(len(rows)) - np.repeat(group_start, np.diff(np.r_[group_start, len(rows)]))
+        positions = fill[rows] + rank
+        indices[positions] = cols
+        weights[positions] = vals
+        fill += np.bincount(rows, minlength=n)
+
+    # Sort every row and merge repeated edges, compacting towards the front in place
+    row_counts = np.zeros(n, dtype=np.int64)
+    write = 0
+    for start, stop in _row_blocks(raw_indptr, chunksize):
+        lo, hi = raw_indptr[start], raw_indptr[stop]
+        rows = np.repeat(np.arange(start, stop), np.diff(raw_indptr[start:stop + 1]))
+        cols = np.asarray(indices[lo:hi])
+        vals = np.asarray(weights[lo:hi])
+        order = np.lexsort((cols, rows))
+        rows, cols, vals = rows[order], cols[order], vals[order]
+        if len(rows):
+            first = np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])]
+            vals = np.add.reduceat(vals, np.flatnonzero(first))
+            rows, cols = rows[first], cols[first]
+        indices[write:write + len(cols)] = cols
+        weights[write:write + len(cols)] = vals
+        row_counts[start:stop] = np.bincount(rows - start, minlength=stop - start)
+        write += len(cols)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(row_counts, out=indptr[1:])
+
+    if out_path is None:
+        return CSRGraph(indptr, indices[:write].copy(), weights[:write].copy(), labels=labels)
+
+    arrays = create_graph_file(out_path, n, write, weight_dtype)
+    arrays["indptr"][:] = indptr
+    arrays["node_weights"][:] = 1
+    for lo in range(0, write, chunksize):
+        hi = min(lo + chunksize, write)
+        arrays["indices"][lo:hi] = indices[lo:hi]
+        arrays["weights"][lo:hi] = weights[lo:hi]
+    for array in arrays.values():
+        if isinstance(array, np.memmap):
+            array.flush()
+    del arrays, indices, weights, scratch
+    os.remove(scratch_path)
+    np.save(out_path + ".labels.npy", np.array(labels, dtype=str))
+    return open_graph(out_path, labels=labels)
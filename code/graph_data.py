@@ -1,41 +1,105 @@
-import pandas as pd
-import networkx as nx
-import matplotlib.pyplot as plt
+import os
 
-# Read the CSV file into a DataFrame
+import numpy as np
+
+from csr_graph import CSRGraph
+from edge_ingest import read_edge_csv
+
+# Read the CSV files into a CSRGraph, cached as .npz next to them. pandas, networkx and matplotlib are only
+# imported by the methods that need them, so loading from the cache imports none of them.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 
 class GraphData:
-    def __init__(self):
-        df_nodes = pd.read_csv("./data/stack_network_nodes.csv")
-        df_edges = pd.read_csv("./data/stack_network_links.csv")
-        # print(df_nodes)
-        # print(df_edges)
-        self.G = nx.Graph()
-        self.H = nx.Graph()
-        for _, row in df_nodes.iterrows():
-            # Assuming the first column contains node labels
-            node_label = row[0]
-            # Assuming the 'group' column contains community labels
-            community = row['group']
-            self.G.add_node(node_label, group=community)
-            self.H.add_node(node_label)
+    """
+    The StackOverflow tag network.
 
-        # Assign a color to each community
-        communities = set(nx.get_node_attributes(self.G, 'group').values())
-        print(communities)
+    Attributes:
+        graph (CSRGraph): The tag graph, weighted by the links "value" column and labelled by tag name.
+        groups (np.ndarray): The "group" of every node from the nodes CSV, -1 for tags that only appear in links.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, use_cache=True):
+        """
+        Loads the tag network, from the .npz cache when it is newer than both CSVs.
+
+        Args:
+            data_dir (str): Directory holding stack_network_nodes.csv and stack_network_links.csv. Defaults
+                to the data directory next to this file, whatever the working directory.
+            use_cache (bool): Read and write data_dir/stack_network.npz.
+        """
+        nodes_path = os.path.join(data_dir, "stack_network_nodes.csv")
+        links_path = os.path.join(data_dir, "stack_network_links.csv")
+        cache_path = os.path.join(data_dir, "stack_network.npz")
+        self._G = None
+        self._H = None
+
+        if use_cache and os.path.exists(cache_path) and \
+                os.path.getmtime(cache_path) >= max(os.path.getmtime(nodes_path), os.path.getmtime(links_path)):
+            self._load_cache(cache_path)
+        else:
+            self._load_csv(nodes_path, links_path)
+            if use_cache:
+                self._save_cache(cache_path)
+
+    def _load_csv(self, nodes_path, links_path):
+        import pandas as pd
 
-        community_colors = {}
-        for idx, community in enumerate(communities):
-            community_colors[community] = plt.cm.tab10(idx)
+        df_nodes = pd.read_csv(nodes_path)
 
-        # Create a list of node colors based on their communities
-        self.node_colors = [community_colors[self.G.nodes[node]['group']] for node in self.G.nodes()]
+        # The listed tags get the first ids, in file order; tags only seen in the links come after them
+        self.graph = read_edge_csv(links_path, labels=df_nodes.iloc[:, 0].tolist())
+        self.groups = np.full(len(self.graph), -1, dtype=np.int64)
+        self.groups[:len(df_nodes)] = df_nodes["group"].to_numpy()
 
-        edges_data = [(row['source'], row['target']) for _, row in df_edges.iterrows()] #  {'weight': row['value']}
-        self.G.add_edges_from(edges_data)
-        self.H.add_edges_from(edges_data)
+    def _save_cache(self, cache_path):
+        np.savez(
+            cache_path,
+            indptr=self.graph.indptr,
+            indices=self.graph.indices,
+            weights=self.graph.weights,
+            labels=np.array(self.graph.labels, dtype=str),
+            groups=self.groups,
+        )
+
+    def _load_cache(self, cache_path):
+        with np.load(cache_path) as cache:
+            self.graph = CSRGraph(cache["indptr"], cache["indices"], cache["weights"], labels=cache["labels"].tolist())
+            self.groups = cache["groups"]
+
+    @property
+    def G(self):
+        """
+        The tag graph as a networkx graph with a 'group' attribute on every node, built on first use.
+        """
+        if self._G is None:
+            import networkx as nx
+
+            self._G = self.graph.to_networkx(with_labels=True)
+            nx.set_node_attributes(self._G, dict(zip(self.graph.labels, self.groups.tolist())), "group")
+        return self._G
+
+    @property
+    def H(self):
+        """
+        The tag graph as a networkx graph without node attributes, built on first use.
+        """
+        if self._H is None:
+            self._H = self.graph.to_networkx(with_labels=True)
+        return self._H
+
+    @property
+    def node_colors(self):
+        import matplotlib.pyplot as plt
+
+        # Assign a color to each community
+        community_colors = {community: plt.cm.tab10(idx) for idx, community in enumerate(np.unique(self.groups).tolist())}
+        return [community_colors[group] for group in self.groups.tolist()]
 
     def draw(self, h=False):
+        import matplotlib.pyplot as plt
+        import networkx as nx
+
         if h:
             nx.draw(self.H, node_size=50) # , with_labels=True
             plt.show()
@@ -46,4 +110,4 @@ class GraphData:
 
 if __name__ == "__main__":
     graph = GraphData()
-    graph.draw(h=False)
\ No newline at end of file
+    graph.draw(h=False)
@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+
+from csr_graph import CSRGraph
+
+# Binary graph file: a 32 byte header followed by the indptr, indices, weights and node_weights arrays,
+# each starting on an 8 byte boundary, so that every array can be memory-mapped in place.
+MAGIC = b"CSRGRPH1"
+HEADER = np.dtype([("magic", "S8"), ("n", "<u8"), ("nnz", "<u8"), ("weight_dtype", "S8")])
+
+
+def _layout(n, nnz, weight_dtype):
+    """
+    Computes where each array lives in a graph file.
+
+    Returns:
+        tuple: (arrays, size), a list of (name, offset, dtype, length) and the total file size in bytes.
+    """
+    arrays = []
+    offset = HEADER.itemsize
+    for name, dtype, length in (
+        ("indptr", np.dtype("<i8"), n + 1),
+        ("indices", np.dtype("<i4"), nnz),
+        ("weights", weight_dtype, nnz),
+        ("node_weights", np.dtype("<f8"), n),
+    ):
+        arrays.append((name, offset, dtype, length))
+        offset += -(-(dtype.itemsize * length) // 8) * 8
+    return arrays, offset
+
+
+def _map(path, mode, n, nnz, weight_dtype):
+    arrays, _ = _layout(n, nnz, weight_dtype)
+    # np.memmap cannot map zero bytes, so empty arrays are plain arrays
+    return {
+        name: np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(length,)) if length else np.zeros(0, dtype)
+        for name, offset, dtype, length in arrays
+    }
+
+
+def create_graph_file(path, n, nnz, weight_dtype=np.float32):
+    """
+    Creates a graph file of the given dimensions and maps its arrays for writing, so that a graph can be
+    filled in on disk without first building it in RAM.
+
+    Args:
+        path (str): The file to create, overwritten if it exists.
+        n (int): Number of nodes.
+        nnz (int): Number of stored adjacency entries, i.e. indptr[-1].
+        weight_dtype (np.dtype): Edge weight type, float32 or float64.
+
+    Returns:
+        dict: Writable memmaps named indptr, indices, weights and node_weights.
+    """
+    weight_dtype = np.dtype(weight_dtype).newbyteorder("<")
+    header = np.zeros(1, dtype=HEADER)
+    header[0] = (MAGIC, n, nnz, weight_dtype.str.encode())
+    _, size = _layout(n, nnz, weight_dtype)
+    with open(path, "wb") as f:
+        f.truncate(size)
+        header.tofile(f)
+    return _map(path, "r+", n, nnz, weight_dtype)
+
+
+def write_graph(G, path, weight_dtype=np.float32):
+    """
+    Writes a CSRGraph to a graph file, one block of rows at a time.
+
+    Args:
+        G (CSRGraph): The graph.
+        path (str): The file to write.
+        weight_dtype (np.dtype): Type to store the edge weights as.
+    """
+    arrays = create_graph_file(path, len(G), len(G.indices), weight_dtype)
+    arrays["indptr"][:] = G.indptr
+    arrays["node_weights"][:] = G.node_weights
+    lo = 0
+    for _, targets, weights in G.edge_chunks():
+        arrays["indices"][lo:lo + len(targets)] = targets
+        arrays["weights"][lo:lo + len(targets)] = weights
+        lo += len(targets)
+    for array in arrays.values():
+        if isinstance(array, np.memmap):
+            array.flush()
+
+
+def open_graph(path, labels=None):
+    """
+    Opens a graph file without reading it into memory. The CSR arrays stay memory-mapped read-only; only
+    the per-node weighted degrees are computed, in one sequential pass.
+
+    Args:
+        path (str): The graph file.
+        labels (sequence, optional): Node labels. Defaults to those saved in path + ".labels.npy" if that
+            file exists, else to the node ids.
+
+    Returns:
+        CSRGraph: The memory-mapped graph.
+    """
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if len(header) != 1 or header[0]["magic"] != MAGIC:
+        raise ValueError(f"{path} is not a graph file")
+    n, nnz = int(header[0]["n"]), int(header[0]["nnz"])
+    arrays = _map(path, "r", n, nnz, np.dtype(header[0]["weight_dtype"].decode()))
+    if labels is None and os.path.exists(path + ".labels.npy"):
+        labels = np.load(path + ".labels.npy").tolist()
+    return CSRGraph(arrays["indptr"], arrays["indices"], arrays["weights"], arrays["node_weights"], labels)
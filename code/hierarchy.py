@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class Hierarchy:
+    """
+    The levels of a Louvain or Leiden run, from the nodes of the graph up to the final communities.
+
+    Level 0 maps the nodes of the graph to the nodes of the first aggregate graph, level 1 maps those to the
+    nodes of the next one, and so on; the last level maps the nodes of the last aggregate graph to the final
+    communities. In Louvain a level is the partition found at that level. In Leiden it is the refined
+    partition the graph was aggregated by, which is finer; the last level is the final partition.
+
+    Attributes:
+        levels (list of np.ndarray): levels[k] holds the int32 community of every level-k node, numbered
+            0..c - 1 where c is the number of level-(k + 1) nodes.
+    """
+
+    def __init__(self, levels=()):
+        """
+        Initializes a new Hierarchy.
+
+        Args:
+            levels (iterable, optional): The memberships of the levels, from the bottom.
+        """
+        self.levels = []
+        for membership in levels:
+            self.append(membership)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __repr__(self):
+        return f"Hierarchy(nodes={self.n_nodes}, communities={[self.n_communities(k) for k in range(len(self))]})"
+
+    @property
+    def n_nodes(self):
+        """
+        The number of nodes of the graph.
+        """
+        return len(self.levels[0]) if self.levels else 0
+
+    def append(self, membership):
+        """
+        Adds a level on top.
+
+        Args:
+            membership (array-like): Community id of every node of the current top level.
+        """
+        membership = np.asarray(membership, dtype=np.int32)
+        if self.levels and len(membership) != self.n_communities(-1):
+            raise ValueError(f"level has {len(membership)} nodes, expected {self.n_communities(-1)}")
+        self.levels.append(membership)
+
+    def n_communities(self, level=-1):
+        """
+        Args:
+            level (int): A level, negative values counting from the top.
+
+        Returns:
+            int: The number of communities at that level.
+        """
+        return int(self.levels[level].max(initial=-1)) + 1
+
+    def resolve(self, level=-1):
+        """
+        The communities of a level as a membership of the nodes of the graph, found by indexing each level
+        with the one below in one vectorised step.
+
+        Args:
+            level (int): A level, negative values counting from the top; -1, the default, gives the final
+                communities.
+
+        Returns:
+            np.ndarray: The int32 community id of every node of the graph, as numbered at that level.
+        """
+        top = range(len(self.levels))[level]
+        membership = self.levels[0].copy()
+        for k in range(1, top + 1):
+            membership = self.levels[k][membership]
+        return membership
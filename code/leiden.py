@@ -1,7 +1,9 @@
 import networkx as nx
 import numpy as np
-import matplotlib.pyplot as plt
-import math
+
+from csr_graph import CSRGraph
+from quality import membership_from_communities, partition_cpm
+from render import draw_partition
 
 # def modularity(G, communities, total_weight):
 #     """
@@ -29,16 +31,13 @@ import math
 
 
 def modularity(G, communities, gamma=1/7):
-    total = 0
-    for comm in communities:
-        E_C_C = get_edges_between_sets(comm, comm, G)
-        total += E_C_C - (gamma * math.comb(len(comm), 2))
-    return total
+    if not isinstance(G, CSRGraph):
+        G = CSRGraph.from_networkx(G)
+    return partition_cpm(G, membership_from_communities(G, communities), gamma)
 
 def get_edges_between_sets(sub1, sub2, G):
     """
-    Get the number of edges between two subsets or partitions in G.
-    Will fail if there is overlap between the sets.
+    Get the total weight of the edges between two subsets or partitions in G, counting every edge once.
 
     Args:
         sub1: frozenset iterable containing nodes (int) in G
@@ -46,14 +45,16 @@ def get_edges_between_sets(sub1, sub2, G):
         G: nx.graph containing sub1 and sub2
     
     Returns:
-        Int representing the number of edges between the two sets
+        Float representing the weight of the edges between the two sets
     """
-    edges = []
+    total = 0
     for u in sub1:
-        for v in sub2:
-            if v in G[u] and (u,v) not in edges and (v,u) not in edges:
-                edges.append((u,v))
-    return len(edges)
+        for v, data in G[u].items():
+            if v in sub2:
+                # An edge with both ends in both sets is also found from v, so each sighting counts half
+                w = data.get("weight", 1)
+                total += w / 2 if u != v and u in sub2 and v in sub1 else w
+    return total
 
 # def modularity(G, P):
 #     """
@@ -130,7 +131,8 @@ def leiden_algorithm(G):
     - partition: dictionary containing node IDs as keys and community IDs as values
     """
     partition = {node: i for i, node in enumerate(G.nodes())}
-    mod = modularity(G, [list(G.nodes)])
+    csr = CSRGraph.from_networkx(G)
+    mod = modularity(csr, [list(G.nodes)])
 
     improvement = True
     iters = 0
@@ -145,7 +147,7 @@ def leiden_algorithm(G):
                     # refine_partition(G, partition)
                     new_partition = partition.copy()
                     new_partition[node] = new_partition[neighbor]
-                    new_mod = modularity(G, [list(comm) for comm in nx.connected_components(G.subgraph(new_partition.keys()))])
+                    new_mod = modularity(csr, [list(comm) for comm in nx.connected_components(G.subgraph(new_partition.keys()))])
                     # print(best_mod, new_mod)
                     if new_mod > best_mod:
                         best_mod = new_mod
@@ -159,19 +161,19 @@ def leiden_algorithm(G):
 
     return partition
 
-def draw_partitioned_graph(G, P):
-    pos = nx.spring_layout(G)  # Positions for all nodes
-
-    # Create a mapping from nodes to communities
-    node_to_community = {node: comm for comm in P for node in comm}
-    # print(set(node_to_community.values()), len(set(node_to_community.values())))
-
-    # Assign colors based on communities
-    colors = [hash(node_to_community[node]) % len(node_to_community.values()) for node in G.nodes()]
+def draw_partitioned_graph(G, P, path="partition.png"):
+    """
+    Writes a drawing of the partition P of G to an image file, see render.draw_partition.
 
-    nx.draw(G, pos, node_color=colors, with_labels=True)
-    plt.show()
+    Args:
+        G (CSRGraph or nx.Graph): The graph.
+        P (iterable or dict): The communities, as sets of nodes or as a dict from node to community.
+        path (str): The file to write.
 
+    Returns:
+        str: path.
+    """
+    return draw_partition(G, P, path)
 
 if __name__ == "__main__":
     G = nx.karate_club_graph()
@@ -1,8 +1,18 @@
-import networkx as nx
 import random
-import math
+import time
 import numpy as np
-import matplotlib.pyplot as plt
+
+from community_scratch import CommunityScratch
+from convergence import Convergence
+from csr_graph import CSRGraph
+from hierarchy import Hierarchy
+from merge_sampler import MergeSampler
+from node_queue import NodeQueue
+from observer import ProfileObserver
+from parallel_moving import LocalMovingPool, move_nodes_parallel
+from partition import Partition
+from quality import CPM, make_quality
+from render import draw_partition
 
 def singleton_partition(G):
     """
@@ -14,114 +24,55 @@ def singleton_partition(G):
     Returns:
         set of frozensets: A partition of the graph where each node is in its own singleton community.
     """
-    return {frozenset({v}) for v in G.nodes()}
+    return {frozenset({v}) for v in G.nodes}
 
-def make_graph(V, E):
-    """
-    Make a graph given vertices and edges
-    Args:
-        V: A set representing the partitions of the graph
-        E: A list of (u,v) tuples representing edges
+def draw_partitioned_graph(G, P, path="partition.png"):
     """
-    G = nx.Graph()
-    G.add_nodes_from(V)
-    G.add_edges_from(E)
-    return G
+    Writes a drawing of the partition P of G to an image file, see render.draw_partition.
 
-class Graph():
-    """
-    Represents a graph with a set of nodes and edges.
+    Args:
+        G (CSRGraph or nx.Graph): The graph.
+        P (iterable or dict): The communities, as sets of nodes or as a dict from node to community.
+        path (str): The file to write.
 
-    Attributes:
-        nodes (set): The set of nodes in the graph.
-        edges (set): The set of edges in the graph, where each edge is represented as a tuple (node1, node2).
+    Returns:
+        str: path.
     """
+    return draw_partition(G, P, path)
 
-    def __init__(self, nodes, edges):
-        """
-        Initializes a new Graph object.
-
-        Args:
-            nodes (set): The set of nodes for the graph.
-            edges (set): The set of edges for the graph, where each edge is represented as a tuple (node1, node2).
-        """
-        self.nodes = nodes
-        self.edges = edges
-
-    def __repr__(self):
-        """
-        Returns a string representation of the graph.
-        """
-        return f"Graph(nodes={self.nodes}, edges={self.edges})"
-
-    def draw(self):
-        """
-        Draws the graph using NetworkX and Matplotlib, displaying only the numbers for each node label.
-        """
-        G = nx.Graph()
-        # Create a mapping from frozenset nodes to numbers
-        node_labels = {node: list(node)[0] for node in self.nodes}
-        G.add_nodes_from(node_labels.values())
-        G.add_edges_from([(node_labels[u], node_labels[v]) for u, v in self.edges])
-        nx.draw(G, with_labels=True, node_color='lightblue')
-        plt.show()
-
-def draw_partitioned_graph(G, P):
-    pos = nx.spring_layout(G)  # Positions for all nodes
-
-    # Create a mapping from nodes to communities
-    node_to_community = {node: comm for comm in P for node in comm}
-
-    # Assign colors based on communities
-    colors = [hash(node_to_community[node]) % 256 for node in G.nodes()]
-
-    nx.draw(G, pos, node_color=colors, with_labels=True)
-    plt.show()
-
-from networkx.utils import groups
-def aggregate_graph(G, P):
+def aggregate_graph(G, P, quality=None):
     """
-    Creates an aggregate graph where each community in the partition becomes a node, and an edge is added between two nodes
-    if there is at least one edge between the corresponding communities in the original graph.
+    Creates an aggregate graph where each community in the partition becomes a node. The edge between two
+    aggregate nodes carries the total weight of the edges between the two communities, the weight inside a
+    community becomes a self-loop, and each aggregate node weighs as much as the nodes it contains.
 
     Args:
-        G (graph): The original graph.
-        P (set): The partition of the graph.
+        G (CSRGraph): The original graph.
+        P (Partition): The partition of the graph.
+        quality (Quality, optional): The quality being optimised, whose aggregation rule is used.
 
     Returns:
-        Graph: The aggregate graph.
+        CSRGraph: The aggregate graph. Aggregate node i is community i of P.renumbered().
     """
-    V = P
-    E = set()
-    for (u, v) in G.edges:
-        for C in P:
-            for D in P:
-                if u in C and v in D:
-                    E.add((C, D))
-    G = nx.Graph()
-    G.add_nodes_from(V)
-    G.add_edges_from(E)
-    return G
-
-def recursive_size(s):
+    if quality is None:
+        return G.aggregate(P.renumbered(), len(P))
+    return quality.aggregate(G, P.renumbered(), len(P))
+
+def recursive_size(G, s):
     """
-    Computes ||S||, the recursive size of a set.
-    E.g. {{1,2}, {3,4}, {5,6}} would return 6 despite
-    the normal set size being 3.
+    Computes ||S||, the recursive size of a set of nodes.
+    On an aggregate graph every node stands for a community of the
+    level below, so this is the sum of the node weights rather than
+    the normal set size.
 
     Args:
-        s (set): A set containing frozensets.
+        G (CSRGraph): The graph containing s.
+        s (set): A set of node ids.
 
     Returns:
-        int: The size of the set of frozensets.
+        float: The total size of the nodes in s.
     """
-    size = 0
-    for subset in s:
-        if isinstance(subset, frozenset):
-            size += len(subset)
-        elif isinstance(subset, set):
-            size += recursive_size(subset)
-    return size
+    return float(G.node_weights[list(s)].sum())
 
 def flatten_partition(P):
     """
@@ -138,54 +89,25 @@ def flatten_partition(P):
 
 def get_edges_between_sets(sub1, sub2, G):
     """
-    Get the number of edges between two subsets or partitions in G.
-    Will fail if there is overlap between the sets.
+    Get the total weight of the edges between two subsets or partitions in G, counting every edge once.
 
     Args:
         sub1: frozenset iterable containing nodes (int) in G
-        sub2: frozenset iterable containing nodes (int) in G
-        G: nx.graph containing sub1 and sub2
+        sub2: frozenset containing nodes (int) in G
+        G: CSRGraph containing sub1 and sub2
     
     Returns:
-        Int representing the number of edges between the two sets
+        Float representing the weight of the edges between the two sets
     """
-    edges = []
-    for u in sub1:
-        for v in sub2:
-            if v in G[u] and (u,v) not in edges and (v,u) not in edges:
-                edges.append((u,v))
-    return len(edges)
-
-# Set of functions needed for delta_H_P(v -> C)
-def maybe_move_node(node, community, P):
-    P_new = set()
-    node_moved = False
-    for comm in P:
-        if node in comm and comm != community:
-            P_new.add(comm - {node})
-        else:
-            P_new.add(comm)
-    for comm in P_new:
-        if comm == community:
-            P_new.remove(comm)
-            P_new.add(comm | {node})
-            node_moved = True
-            break
-    if not node_moved:
-        P_new.add(frozenset([node]))
-    return P_new
-
-def constant_potts_quality(G, P, gamma=1/7):
     total = 0
-    for comm in P:
-        E_C_C = get_edges_between_sets(comm, comm, G)
-        total += E_C_C - (gamma * math.comb(recursive_size(comm), 2))
+    for u in sub1:
+        for v, w in zip(G.neighbors(u).tolist(), G.neighbor_weights(u).tolist()):
+            if v in sub2:
+                # An edge with both ends in both sets is also found from v, so each sighting counts half
+                total += w / 2 if u != v and u in sub2 and v in sub1 else w
     return total
 
-def quality_change(G, P, node, target_community):
-    return constant_potts_quality(G, maybe_move_node(node, target_community, P)) - constant_potts_quality(G, P)
-
-# gamma = 0.5
+# gamma
 # the resolution parameter, controls the size of the communities detected by the algorithm.
 # A higher value of gamma tends to result in smaller, more tightly-knit communities, while a
 # lower value tends to produce larger, more inclusive communities.
@@ -197,124 +119,360 @@ def quality_change(G, P, node, target_community):
 # higher value of theta increases the likelihood of accepting moves that result in a smaller
 # increase in partition quality, thereby introducing more randomness into the process.
 
-def merge_nodes_subset(G, partition, subset, gamma=0.5, theta=0.1):
-    R = set()
+def merge_nodes_subset(G, partition, subset, quality=None, theta=0.1, rng=None, sampler=None, scratch=None):
+    """
+    Merges the well-connected nodes of one community into refined clusters, MergeNodesSubset in the paper.
+
+    Each node's weight to the rest of the subset is found in one pass over the edges of the subset, and the
+    cut between every refined cluster and the rest of the subset is updated as nodes join clusters, so the
+    refinement of a subset costs O(edges of its nodes).
+
+    Args:
+        G (CSRGraph): The graph.
+        partition (Partition): The refined partition, updated in place.
+        subset (frozenset): The nodes of one community of the unrefined partition.
+        quality (Quality, optional): The quality to optimise. Defaults to CPM with gamma = 1/7.
+        theta (float): The randomness of the choice between clusters.
+        rng (np.random.Generator, optional): Source of that randomness and of the order the nodes are visited
+            in. Defaults to a fresh unseeded one.
+        sampler (MergeSampler, optional): Buffers for the choice, reused across calls.
+        scratch (CommunityScratch, optional): Buffer for the node's weights to the clusters, reused across
+            calls; it needs a slot for every community id of partition.
+
+    Returns:
+        Partition: The refined partition.
+    """
+    if quality is None:
+        quality = CPM(1/7)
+    if rng is None:
+        rng = np.random.default_rng()
+    if sampler is None:
+        sampler = MergeSampler(int(np.diff(G.indptr).max(initial=0)) + 1)
+    if scratch is None:
+        scratch = CommunityScratch(len(partition.community_counts))
+    node_totals = quality.node_totals(G)
+    totals = quality.community_totals(partition)
+    subset_total = float(node_totals[list(subset)].sum())
+
+    # Weight from every node to the rest of the subset, and from every cluster to the rest of the subset
+    weight_in = {}
+    cut = {}
     for v in subset:
-        s = frozenset([v])
-        # Recursive size of a set s containing one node v might have to be the degree of the node v
-        if get_edges_between_sets(s, subset - s, G) >= gamma * recursive_size(set(s)) * (recursive_size(subset) - recursive_size(set(s))):
-            R.add(v)
+        c = int(partition.community_of(v))
+        weight_in[v] = 0.0
+        cut.setdefault(c, 0.0)
+        for u, w in zip(G.neighbors(v).tolist(), G.neighbor_weights(v).tolist()):
+            if u != v and u in subset:
+                weight_in[v] += w
+                cut[c] += w if partition.community_of(u) != c else 0.0
+
+    # The well-connected nodes, visited in random order
+    R = [v for v in subset if weight_in[v] >= quality.null_weight(node_totals[v], subset_total - node_totals[v])]
+    rng.shuffle(R)
 
     for node in R:
-        if frozenset({node}) in partition: # If v is a singleton community
-            T = set()
-            for comm in partition:
-                well_connected = gamma * recursive_size(comm) * (recursive_size(subset) - recursive_size(comm))
-                if comm.issubset(subset) and get_edges_between_sets(comm, subset-comm, G) >= well_connected:
-                    T.add(comm)
-            delta_hp = {C: quality_change(G, partition, node, C) for C in T}
-            prob = {C: np.exp(1 / theta * delta_hp[C]) if delta_hp[C] >= 0 else 0 for C in T}
-            total_prob = sum(prob.values())
-            if total_prob > 0:
-                prob = {C: p / total_prob for C, p in prob.items()}
-                chosen_community = np.random.choice(list(T), p=list(prob.values()))
-                partition = {C - {v} if v in C else C for C in partition}
-                partition.add(chosen_community | {v})
+        current = int(partition.community_of(node))
+        if partition.community_counts[current] == 1: # If v is a singleton community
+            communities, weights = scratch.gather(G, partition.membership, node)
+            node_total = node_totals[node]
+            # Only the well-connected clusters of the subset that node has edges to can gain, next to
+            # staying on its own
+            sampler.clear()
+            sampler.add(current, 0.0)
+            for C, weight in zip(communities, weights):
+                if C in cut and cut[C] >= quality.null_weight(totals[C], subset_total - totals[C]):
+                    sampler.add(C, quality.move_gain(weight, 0.0, node_total, totals[C], totals[current] - node_total))
+            chosen_community = sampler.sample(theta, rng)
+            if chosen_community != current:
+                partition.move_node(node, chosen_community)
+                weight_to = weights[communities.index(chosen_community)]
+                cut[chosen_community] += weight_in[node] - 2 * weight_to
+                del cut[current]
     return partition
 
-def refine_partition(G, P):
-    P_refined = singleton_partition(G)
-    for C in P:
-        P_refined = merge_nodes_subset(G, P_refined, C)
+def refine_partition(G, P, quality=None, rng=None, communities=None):
+    """
+    Refines every community of P by merging its nodes from singletons, see merge_nodes_subset.
+
+    Args:
+        G (CSRGraph): The graph.
+        P (Partition): The partition to refine.
+        quality (Quality, optional): The quality being optimised. Defaults to CPM with gamma = 1/7.
+        rng (np.random.Generator, optional): Source of the random choices.
+        communities (array-like, optional): Only refine these communities of P. The nodes of every other
+            community form one refined community, as if merging had rebuilt it whole.
+
+    Returns:
+        Partition: The refined partition, in which every community lies inside a community of P.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    sampler = MergeSampler(int(np.diff(G.indptr).max(initial=0)) + 1)
+    if communities is None:
+        P_refined = Partition.singleton(G)
+        subsets = P.to_sets()
+    else:
+        refine = np.isin(P.membership, np.asarray(communities, dtype=np.int64))
+        nodes = np.flatnonzero(refine)
+        # The nodes to refine become singletons with ids past those of P's communities
+        membership = P.membership.astype(np.int64)
+        membership[nodes] = len(P.community_counts) + np.arange(len(nodes))
+        P_refined = Partition(G, membership)
+        order = nodes[np.argsort(P.membership[nodes], kind="stable")]
+        bounds = np.flatnonzero(np.diff(P.membership[order])) + 1
+        subsets = [set(subset.tolist()) for subset in np.split(order, bounds) if len(subset)]
+    scratch = CommunityScratch(len(P_refined.community_counts))
+    for C in subsets:
+        P_refined = merge_nodes_subset(G, P_refined, C, quality, rng=rng, sampler=sampler, scratch=scratch)
     return P_refined
 
-def move_nodes_fast(G, P):
+def move_nodes_fast(G, P, quality=None, pool=None, rng=None, nodes=None, convergence=None, observer=None):
     """
     Moves nodes to different communities to improve the partition quality of the graph.
 
     Args:
-        G (Graph): The graph for which the partition is being optimized.
-        P (set): The current partition of the graph, where each element is a set representing a community.
+        G (CSRGraph): The graph for which the partition is being optimized.
+        P (Partition): The current partition of the graph, updated in place.
+        quality (Quality, optional): The quality to optimise. Defaults to CPM with gamma = 1/7.
+        pool (LocalMovingPool, optional): Spread the moves over these worker processes, see
+            move_nodes_parallel.
+        rng (np.random.Generator, optional): Visit the nodes in a random order drawn from rng rather than
+            in node order. The parallel moves have their own order and ignore it.
+        nodes (array-like, optional): Only queue these nodes at the start, instead of every node. Nodes
+            outside them are still visited when a neighbour moves.
+        convergence (Convergence, optional): When to stop before the queue runs empty. Every len(G) node
+            visits count as one pass.
+        observer (Observer, optional): Told about every pass, see observer.
 
     Returns:
-        set: The optimized partition of the graph.
+        Partition: The optimized partition of the graph.
     """
-    Q = list(G.nodes)
+    if quality is None:
+        quality = CPM(1/7)
+    if convergence is None:
+        convergence = Convergence()
+    if pool is not None:
+        return move_nodes_parallel(G, P, quality, pool, fast=True, nodes=nodes, convergence=convergence,
+                                   observer=observer)
+    node_totals = quality.node_totals(G)
+    totals = quality.community_totals(P)
+    order = np.arange(len(G)) if nodes is None else np.asarray(nodes, dtype=np.int64)
+    if rng is not None:
+        order = rng.permutation(order)
+    Q = NodeQueue(len(G), order.tolist())
+    scratch = CommunityScratch(len(P.community_counts))
+    current = quality(G, P.membership) if convergence.tolerance > 0 else 0.0
+    passes = 0
+    visits = 0
+    gain = 0.0
+    moves = 0
+    started = time.perf_counter()
     while Q:
-        v = Q.pop(0)
-        best_delta = 0
-        best_community = None
-        for C in P.union({frozenset()}):
-            delta = quality_change(G, P, v, C)
+        if convergence.expired():
+            break
+        v = Q.pop()
+        visits += 1
+        old = P.community_of(v)
+        communities, weights = scratch.gather(G, P.membership, v)
+        node_total = node_totals[v]
+        weight_to_old = weights[communities.index(old)] if old in communities else 0.0
+        old_total = totals[old] - node_total
+        # Only the neighbouring communities and an empty one can be the best move, see
+        # parallel_moving.score_moves
+        best_community = P.get_empty_community()
+        best_delta = quality.move_gain(0.0, weight_to_old, node_total, 0.0, old_total)
+        for C, weight in zip(communities, weights):
+            if C == old:
+                continue
+            delta = quality.move_gain(weight, weight_to_old, node_total, totals[C], old_total)
             if delta > best_delta:
                 best_delta = delta
                 best_community = C
         if best_delta > 0:
-            # Find the community that currently contains v
-            current_community = next((comm for comm in P if v in comm), None)
-            if current_community is not None:
-                # Update the partition
-                P.remove(current_community)
-                P.add(current_community - {v})
-            if best_community is not None:
-                if best_community in P:
-                    P.remove(best_community)
-                    P.add(best_community.union({v}))
-                else:
-                    P.add(frozenset({v}))
-            # Update the queue
-            N = {u for (u, _) in G.edges if u not in best_community}
-            Q.extend(list(N - set(Q)))
+            P.move_node(v, best_community)
+            gain += best_delta
+            moves += 1
+            # Queue the neighbours of v that are not in its new community
+            for u in G.neighbors(v).tolist():
+                if P.community_of(u) != best_community:
+                    Q.push(u)
+        if visits == len(G):
+            passes += 1
+            stop = bool(Q) and convergence.stop_pass(passes, gain, current)
+            if observer is not None:
+                observer.on_pass({
+                    "pass": passes, "moves": moves, "gain": gain, "queue": 0 if stop else len(Q),
+                    "seconds": time.perf_counter() - started,
+                })
+            if stop:
+                break
+            current += gain
+            visits = 0
+            gain = 0.0
+            moves = 0
+            started = time.perf_counter()
+    if visits and observer is not None:
+        # The last, partial pass
+        observer.on_pass({
+            "pass": passes + 1, "moves": moves, "gain": gain, "queue": 0, "seconds": time.perf_counter() - started,
+        })
     return P
 
 
-def Leiden(G, initial_partition=None):
+def run_leiden(G, P, quality, rng, pool=None, convergence=None, observer=None):
     """
-    Executes the Leiden algorithm to detect communities in a graph.
+    The iterations of the Leiden algorithm, keeping track of the community of every node of G across the
+    aggregations.
 
     Args:
-        G (Graph): The graph for which communities are to be detected.
-        initial_partition (set, optional): An initial partition of the graph. If not provided, a singleton
-            partition is used as the starting point.
+        G (CSRGraph): The graph.
+        P (Partition): The starting partition of G.
+        quality (Quality): The quality to optimise.
+        rng (np.random.Generator): Source of the node orders and of the refinement's random choices.
+        pool (LocalMovingPool, optional): Workers for local moving.
+        convergence (Convergence, optional): Stopping rules, already started. By default the iterations
+            continue until local moving changes nothing.
+        observer (Observer, optional): Told about the run, every pass and every level, see observer.
 
     Returns:
-        set: The final partition of the graph, where each element is a set representing a community.
+        tuple: (P, hierarchy, iterations), the final partition of the last aggregate graph, the Hierarchy
+            from the nodes of G to the communities of P, and the number of levels of local moving.
     """
-    if initial_partition is None:
-        P = singleton_partition(G)
-    else:
-        P = initial_partition
+    if convergence is None:
+        convergence = Convergence()
+    hierarchy = Hierarchy()
+    if observer is not None:
+        run_started = time.perf_counter()
+        observer.on_start({"algorithm": "leiden", "nodes": len(G), "edges": G.number_of_edges()})
     done = False
     iters = 0
     while not done:
-        print("iters", iters)
-        P = move_nodes_fast(G, P)
-        done = len(P) == len(G.nodes)
+        started = time.perf_counter()
+        P = move_nodes_fast(G, P, quality, pool, rng, convergence=convergence, observer=observer)
+        seconds = {"move": time.perf_counter() - started}
+        iters += 1
+        done = len(P) == len(G.nodes) or convergence.stop_level(iters)
+        level = {"level": iters - 1, "nodes": len(G), "communities": len(P)}
+        if observer is not None:
+            level["quality"] = float(quality(G, P.membership))
         if not done:
             # if iters == 2:
             #     return P
-            P_refined = refine_partition(G, P)
-            G = aggregate_graph(G, P_refined)
-            for C in P: # Maintain P: for each community
-                print("C", C)
-                new = []
-                for v in C: # for each node
-                    curr = []
-                    if v in G.nodes: # if in G
-                        curr.append(v)
-                    curr = frozenset(curr)
-                    new.append(curr) # add to P
-            P = set(new) # convert to set
-            print(len(G.nodes), len(P))
-            print("P:\n" , P)
-        iters += 1
-    return flatten_partition(P)
+            started = time.perf_counter()
+            P_refined = refine_partition(G, P, quality, rng)
+            seconds["refine"] = time.perf_counter() - started
+            # Nothing merged means aggregating would give back the same graph
+            done = len(P_refined) == len(G.nodes)
+        if not done:
+            started = time.perf_counter()
+            refined = P_refined.renumbered()
+            G = aggregate_graph(G, P_refined, quality)
+            hierarchy.append(refined)
+            # Maintain P: every aggregate node is a refined community, which lies inside one community of P
+            membership = np.empty(len(G), dtype=np.int32)
+            membership[refined] = P.membership
+            P = Partition(G, membership)
+            seconds["aggregate"] = time.perf_counter() - started
+        if observer is not None:
+            observer.on_level({**level, "seconds": seconds})
+    if not hierarchy or len(P) < len(G):
+        hierarchy.append(P.renumbered())
+    if observer is not None:
+        observer.on_end({
+            "levels": iters, "communities": len(P), "quality": float(quality(G, P.membership)),
+            "seconds": time.perf_counter() - run_started,
+        })
+    return P, hierarchy, iters
+
+
+def Leiden(G, initial_partition=None, quality="cpm", gamma=None, seed=None, workers=1, n_starts=1, save_to=None,
+           return_hierarchy=False, convergence=None, observer=None, return_stats=False):
+    """
+    Executes the Leiden algorithm to detect communities in a graph.
+
+    Args:
+        G (CSRGraph or nx.Graph): The graph for which communities are to be detected.
+        initial_partition (set, Partition or str, optional): An initial partition of the graph, or a partition
+            file to warm-start from, see partition_file.read_partition. If not provided, a singleton partition
+            is used as the starting point.
+        quality (str or Quality): The quality to optimise, see make_quality.
+        gamma (float, optional): The resolution parameter when quality is given by name.
+        seed (int or np.random.Generator, optional): Seed of the node orders and the refinement's random
+            choices.
+        workers (int): Number of processes for local moving, or for the restarts when n_starts > 1; 1 runs
+            everything serially.
+        n_starts (int): Number of independent restarts, of which the one of the highest quality is kept. See
+            multi_start.multi_start, which also reports the statistics of every restart.
+        save_to (str, optional): Write the communities found to this partition file, see
+            partition_file.write_partition.
+        return_hierarchy (bool): Return the Hierarchy of the run instead, whose resolve() gives the
+            communities of any level for the nodes of G.
+        convergence (Convergence, optional): Stopping rules; its clock starts here, and again for every
+            restart. By default the run continues until local moving changes nothing.
+        observer (Observer, optional): Told about every pass and level, see observer. By default the run is
+            silent. With n_starts > 1 it is ignored, and multi_start's records describe the restarts instead.
+        return_stats (bool): Also return the statistics of every run.
+
+    Returns:
+        set: The final partition of the graph, where each element is a set representing a community. With
+            return_stats, a tuple of it (or the Hierarchy) and a list with one dict per restart, as in the
+            records of multi_start.multi_start; a single run has one record.
+    """
+    if not isinstance(G, CSRGraph):
+        G = CSRGraph.from_networkx(G)
+        if initial_partition is not None and not isinstance(initial_partition, str):
+            index = {label: i for i, label in enumerate(G.labels)}
+            initial_partition = {frozenset(index[v] for v in C) for C in initial_partition}
+    if initial_partition is None:
+        P = Partition.singleton(G)
+    elif isinstance(initial_partition, Partition):
+        # Local moving works in place; the caller's partition is left as it was
+        P = initial_partition.copy()
+    elif isinstance(initial_partition, str):
+        from partition_file import read_partition
+
+        P = read_partition(initial_partition, G)
+    else:
+        P = Partition.from_sets(G, initial_partition)
+    quality = make_quality(G, quality, gamma)
+    if n_starts > 1:
+        from multi_start import multi_start
+
+        if isinstance(seed, np.random.Generator):
+            seed = int(seed.integers(2**63))
+        membership = None if initial_partition is None else P.membership
+        P, hierarchy, records = multi_start(G, quality, n_starts, membership, seed, workers, convergence)
+    else:
+        from multi_start import run_record
+
+        rng = np.random.default_rng(seed)
+        convergence = (Convergence() if convergence is None else convergence).start()
+        pool = LocalMovingPool(workers) if workers > 1 else None
+        started = time.perf_counter()
+        try:
+            P, hierarchy, levels = run_leiden(G, P, quality, rng, pool, convergence, observer)
+        finally:
+            if pool is not None:
+                pool.close()
+        records = None
+        if return_stats:
+            records = [dict(run_record(G, quality, hierarchy, levels, 0, time.perf_counter() - started), best=True)]
+    if save_to is not None:
+        from partition_file import write_partition
+
+        write_partition(save_to, G, hierarchy.resolve())
+    result = hierarchy if return_hierarchy else flatten_partition(P.to_sets())
+    if return_stats:
+        return result, records
+    return result
 
 if __name__ == "__main__":
-    G = nx.karate_club_graph()
-    S = {node for node, degree in G.degree() if degree >= 3}
+    import networkx as nx
+
+    G = CSRGraph.from_networkx(nx.karate_club_graph())
+    S = {node for node in G.nodes if G.degree(node) >= 3}
     # print(S)
-    P = singleton_partition(G)
+    P = Partition.singleton(G)
     # print(P)
 
     # Test merge_subsets code
@@ -328,11 +486,11 @@ if __name__ == "__main__":
     #     print("R is:\n", R)
     # test(G, P, {frozenset([1]), frozenset([32]), frozenset([14]), frozenset([23])})
 
-    
-    merge_nodes_subset(G, P, S)
-    P_refined = refine_partition(G, P)
-    move_nodes_fast(G, P)
-    print(P)
-    final_Leiden_partition = Leiden(G, P)
+
+    # A cold run from singletons saves its communities, and a second run warm-starts from them
+    profile = ProfileObserver()
+    final_Leiden_partition = Leiden(G, P, seed=0, save_to="karate_partition.npz", observer=profile)
+    print(profile.report())
+    final_Leiden_partition = Leiden(G, "karate_partition.npz", seed=0)
     final_Leiden_partition_draw = {frozenset({node}) for node in final_Leiden_partition}
     draw_partitioned_graph(G, final_Leiden_partition_draw)
@@ -1,53 +1,49 @@
 import networkx as nx
 import numpy as np
-import matplotlib.pyplot as plt
+from csr_graph import CSRGraph
 from graph_data import GraphData
+from quality import Modularity, membership_from_communities
+from render import draw_partition
 
 def modularity(G, communities, total_edges):
     """
     Calculate the modularity of a partition of a graph.
 
     Parameters:
-    - G: NetworkX graph
+    - G: CSRGraph of the graph, built once per run, or a NetworkX graph, which is converted on every call
     - communities: list of lists containing node IDs in each community
-    - total_edges: total number of edges in the graph
+    - total_edges: total edge weight of the graph
     """
-    Q = 0
-    m = total_edges
-    for community in communities:
-        for i in community:
-            ki = G.degree(i)
-            for j in community:
-                kj = G.degree(j)
-                if i != j:
-                    Aij = 1 if G.has_edge(i, j) else 0
-                    Q += (Aij - (ki * kj) / (2 * m))
-    return Q / (2 * m)
-
-def first_phase(G, partition, total_edges):
+    if not isinstance(G, CSRGraph):
+        G = CSRGraph.from_networkx(G)
+    return Modularity(total_edges)(G, membership_from_communities(G, communities))
+
+def first_phase(G, partition, total_edges, csr=None):
     """
     First phase of the Leiden algorithm.
 
     Parameters:
     - G: NetworkX graph
     - partition: dictionary containing node IDs as keys and community IDs as values
-    - total_edges: total number of edges in the graph
+    - total_edges: total edge weight of the graph
+    - csr: G as a CSRGraph, built from G when not given
 
     Returns:
     - partition: updated partition after the first phase
     """
+    csr = CSRGraph.from_networkx(G) if csr is None else csr
     improvement = True
     while improvement:
         improvement = False
         for node in G.nodes():
             current_community = partition[node]
             best_community = current_community
-            best_modularity = modularity(G, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges)
+            best_modularity = modularity(csr, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges)
 
             for neighbor in G.neighbors(node):
                 if partition[neighbor] != current_community:
                     partition[node] = partition[neighbor]
-                    mod = modularity(G, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges)
+                    mod = modularity(csr, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges)
                     if mod > best_modularity:
                         best_modularity = mod
                         best_community = partition[neighbor]
@@ -58,18 +54,20 @@ def first_phase(G, partition, total_edges):
 
     return partition
 
-def second_phase(G, partition, total_edges):
+def second_phase(G, partition, total_edges, csr=None):
     """
     Second phase of the Leiden algorithm.
 
     Parameters:
     - G: NetworkX graph
     - partition: dictionary containing node IDs as keys and community IDs as values
-    - total_edges: total number of edges in the graph
+    - total_edges: total edge weight of the graph
+    - csr: G as a CSRGraph, built from G when not given
 
     Returns:
     - partition: updated partition after the second phase
     """
+    csr = CSRGraph.from_networkx(G) if csr is None else csr
     communities = {c: set() for c in set(partition.values())}
     for node, comm in partition.items():
         communities[comm].add(node)
@@ -83,8 +81,8 @@ def second_phase(G, partition, total_edges):
                     new_partition = partition.copy()
                     for node in nodes2:
                         new_partition[node] = comm1
-                    mod = modularity(G, [list(comm) for comm in nx.connected_components(G.subgraph(new_partition.keys()))], total_edges)
-                    if mod > modularity(G, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges):
+                    mod = modularity(csr, [list(comm) for comm in nx.connected_components(G.subgraph(new_partition.keys()))], total_edges)
+                    if mod > modularity(csr, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges):
                         partition = new_partition
                         improvement = True
                         break
@@ -105,25 +103,30 @@ def leiden_algorithm(G):
     """
     partition = {node: i for i, node in enumerate(G.nodes())}
 
-    total_edges = G.number_of_edges()
+    total_edges = G.size(weight="weight")
+    csr = CSRGraph.from_networkx(G)
     while True:
-        partition = first_phase(G, partition, total_edges)
-        partition = second_phase(G, partition, total_edges)
-        new_modularity = modularity(G, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges)
-        if new_modularity <= modularity(G, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges):
+        partition = first_phase(G, partition, total_edges, csr)
+        partition = second_phase(G, partition, total_edges, csr)
+        new_modularity = modularity(csr, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges)
+        if new_modularity <= modularity(csr, [list(comm) for comm in nx.connected_components(G.subgraph(partition.keys()))], total_edges):
             break
 
     return partition
 
-def draw_partitioned_graph(G, P):
-    pos = nx.spring_layout(G)  # Positions for all nodes
-
-    # Assign colors based on communities
-    colors = [hash(P[node]) % len(P.values()) for node in G.nodes()]
+def draw_partitioned_graph(G, P, path="partition.png"):
+    """
+    Writes a drawing of the partition P of G to an image file, see render.draw_partition.
 
-    nx.draw(G, pos, node_color=colors, with_labels=True)
-    plt.show()
+    Args:
+        G (CSRGraph or nx.Graph): The graph.
+        P (iterable or dict): The communities, as sets of nodes or as a dict from node to community.
+        path (str): The file to write.
 
+    Returns:
+        str: path.
+    """
+    return draw_partition(G, P, path)
 
 if __name__ == "__main__":
     G = nx.karate_club_graph()
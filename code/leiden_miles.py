@@ -1,26 +1,28 @@
 import networkx as nx
 import numpy as np
-import matplotlib.pyplot as plt
 import math
 
+from csr_graph import CSRGraph
+from merge_sampler import MergeSampler
+from quality import Modularity, membership_from_communities, partition_modularity
+from render import draw_partition
+from subset_merge import merge_subset, node_total
+
 def modularity(G, P):
     """
     Calculates the modularity of a partition of a graph.
 
     Args:
-        G (Graph): The graph.
+        G (CSRGraph or Graph): The graph. A networkx graph is converted on every call, so callers that score
+            many partitions should convert it once with CSRGraph.from_networkx.
         P (set): The partition of the graph, where each element is a set representing a community.
 
     Returns:
         float: The modularity of the partition.
     """
-    m = len(G.edges)
-    modularity_value = 0
-    for C in P:
-        L_C = sum(1 for (u, v) in G.edges if u in C and v in C)
-        D_C = sum(sum(1 for (_, v) in G.edges if v in C) for node in C)
-        modularity_value += (L_C / m) - (D_C / (2 * m)) ** 2
-    return modularity_value
+    if not isinstance(G, CSRGraph):
+        G = CSRGraph.from_networkx(G)
+    return partition_modularity(G, membership_from_communities(G, P))
 
 def singleton_partition(G):
     """
@@ -47,94 +49,96 @@ def aggregate_graph(P):
 def locate_community(node, P):
     return next(comm for comm in P if node in comm)
 
-def partition_quality_change(G, P, v_community, C):
+def community_totals(G, P, quality):
     """
-    Calculates the change in modularity when moving a node to a different community.
+    Sums the node totals of every community, the weighted degrees or sizes quality.move_gain takes, once, so
+    that the changes of moves can be scored in O(1) and the sums kept up to date as nodes move.
 
     Args:
         G (Graph): The graph.
-        P (set): The current partition of the graph.
-        v (frozenset): The node to be moved.
-        C (frozenset): The community to which the node will be moved.
+        P (list): The partition of the graph.
+        quality (Quality): The quality.
 
     Returns:
-        float: The change in modularity.
+        dict: The total of every community of P, by the id() of its list, as the lists change in place.
     """
-    # Create a new partition without v in its current community
-    v = v_community[0]
-    new_partition = P.copy()
-    new_partition.remove([v])
+    return {id(C): sum(node_total(G, u, quality) for u in C) for C in P}
 
-    # is it necessary to keep the same number of communities?
-    new_partition.append([])
+def partition_quality_change(G, P, v_community, C, quality=None, totals=None):
+    """
+    Calculates the change in quality when moving a node to a different community, with quality.move_gain
+    from the edge weight between the node and the two communities and their totals.
 
-    # Add v to the target community C
-    if C in new_partition:
-        new_partition.remove(C)
-        new_partition.append(C + [v])
-    else:
-        new_partition.append([v])
+    Args:
+        G (Graph): The graph.
+        P (set): The current partition of the graph.
+        v_community (list): The singleton community of the node to be moved.
+        C (list): The community to which the node will be moved.
+        quality (Quality, optional): The quality. Defaults to modularity of G.
+        totals (dict, optional): The total of every community of P, see community_totals. Summed over the
+            two communities when not given.
 
-    current_modularity = modularity(G, P)
-    new_modularity = modularity(G, new_partition)
-    return new_modularity - current_modularity
+    Returns:
+        float: The change in quality.
+    """
+    if quality is None:
+        quality = Modularity(G.size(weight="weight"))
+    v = v_community[0]
+    if C == v_community:
+        return 0.0
+    if totals is None:
+        totals = community_totals(G, (C, v_community), quality)
+
+    neighbors = G[v]
+    weight_to_new = sum(neighbors[u].get("weight", 1) for u in C if u in neighbors and u != v)
+    weight_to_old = sum(neighbors[u].get("weight", 1) for u in v_community if u in neighbors and u != v)
+    v_total = node_total(G, v, quality)
+    return quality.move_gain(weight_to_new, weight_to_old, v_total, totals[id(C)], totals[id(v_community)] - v_total)
 
-gamma = 0.5
 theta = 0.1
-def merge_nodes_subset(G, P, S):
+def merge_nodes_subset(G, P, S, rng=None, sampler=None, gamma=0.5):
     """
-    Refines a given partition of a graph by merging well-connected nodes within a specified subset into communities.
+    Refines a given partition of a graph by merging well-connected nodes within a specified subset into communities,
+    see subset_merge.merge_subset.
 
     Args:
         G (dict): The graph inputted, where keys are nodes and values are dictionaries
                   of neighboring nodes with edge weights.
-        P (dict): The current partition of the graph, where keys are nodes and values are communities.
-        S (set): The subset of nodes within which to merge well-connected nodes.
+        P (list): The refined partition, in which the nodes of S are still singletons.
+        S (list): The subset of nodes within which to merge well-connected nodes.
+        rng (np.random.Generator, optional): Source of the random choices. Defaults to a fresh unseeded one.
+        sampler (MergeSampler, optional): Buffers for the choices, reused across calls.
+        gamma (float): The resolution of the well-connectedness checks.
 
     Returns:
-        dict: The updated partition of the graph after merging well-connected nodes within the subset.
+        list: The updated partition of the graph after merging well-connected nodes within the subset.
     """
-    # Calculate the degree of each node and the subset
-    k = {v: len(G[v]) for v in S}
-    k_S = sum(k.values())
-
-    # Consider only nodes that are well connected within the subset
-    R = {v for v in S if sum(1 for u in G[v] if u in S and u != v) >= gamma * k[v] * (k_S - k[v])}
-
-    for v in R:
-        # Consider only nodes that are in singleton communities
-        if [v] in P:
-            # Consider only well-connected communities
-            T = {C for C in P if C.issubset(S) and
-                 sum(1 for u in C for w in S - C if w in G[u]) >= gamma * sum(k[u] for u in C) * (k_S - sum(k[u] for u in C))}
-
-            # Find the community v is in
-            current_community = locate_community(v, P)
-            # Choose a random community to move the node to, based on a probability proportional to the change in partition quality
-            delta_hp = {C: partition_quality_change(G, P, current_community, C) for C in T}
-            prob = {C: np.exp(1 / theta * delta_hp[C]) if delta_hp[C] >= 0 else 0 for C in T}
-            total_prob = sum(prob.values())
-            if total_prob > 0:
-                prob = {C: p / total_prob for C, p in prob.items()}
-                chosen_community = np.random.choice(list(T), p=list(prob.values()))
-                # Update P by removing v from its current community and adding it to the chosen community
-                P.remove([v])
-                P.append(chosen_community + [v])
-
+    if rng is None:
+        rng = np.random.default_rng()
+    if sampler is None:
+        sampler = MergeSampler(max((d for _, d in G.degree()), default=0) + 1)
+    communities = merge_subset(G, S, Modularity(G.size(weight="weight")), rng, sampler, gamma, theta)
+    S_nodes = set(S)
+    P[:] = [C for C in P if not (len(C) == 1 and C[0] in S_nodes)] + communities
     return P
 
-def refine_partition(G, P):
+def refine_partition(G, P, rng=None, gamma=0.5):
+    if rng is None:
+        rng = np.random.default_rng()
+    sampler = MergeSampler(max((d for _, d in G.degree()), default=0) + 1)
     P_refined = singleton_partition(G)
     for comm in P:
-        P_refined = merge_nodes_subset(G, P, comm)
+        P_refined = merge_nodes_subset(G, P_refined, comm, rng, sampler, gamma)
     return P_refined
 
 def move_nodes_fast(G, P):
     queue = []
+    quality = Modularity(G.size(weight="weight"))
+    totals = community_totals(G, P, quality)
     while len(queue) > 0:
         v = queue.pop(0)
         v_community = locate_community(v, P)
-        possibilities = {comm : partition_quality_change(G, P, v_community, comm) for comm in P}
+        possibilities = {comm : partition_quality_change(G, P, v_community, comm, quality, totals) for comm in P}
         best_comm = max(possibilities, key=possibilities.values())
         if best_comm > 0:
             P.remove(v_community)
@@ -143,22 +147,28 @@ def move_nodes_fast(G, P):
             P.remove(best_comm)
             best_comm.append(v)
             P.append(best_comm)
+            v_total = node_total(G, v, quality)
+            totals[id(v_community)] -= v_total
+            totals[id(best_comm)] += v_total
             for neighbor in G[v]:
                 if neighbor not in best_comm:
                     queue.append(neighbor)
 
     return P
 
-def leiden_algorithm(G):
+def leiden_algorithm(G, seed=None, gamma=0.5):
     """
     Leiden algorithm for community detection in graphs.
 
     Parameters:
     - G: NetworkX graph
+    - seed: seed or np.random.Generator of the refinement's random choices
+    - gamma: resolution of the refinement's well-connectedness checks
 
     Returns:
     - partition: dictionary containing node IDs as keys and community IDs as values
     """
+    rng = np.random.default_rng(seed)
     partition = singleton_partition(G)
     partition = move_nodes_fast(G, partition)
 
@@ -168,7 +178,7 @@ def leiden_algorithm(G):
         print("iter", iters)
         done = len(G) == len(partition)
         if not done:
-            P_refined = refine_partition(G, partition)
+            P_refined = refine_partition(G, partition, rng, gamma)
             G = aggregate_graph(G, P_refined)
             partition = [[v for v in C if v in G] for C in partition]
         iters += 1
@@ -181,23 +191,19 @@ def flatten_extend(t):
         flat_list.extend(row)
     return flat_list
 
-def draw_partitioned_graph(G, P):
-    pos = nx.spring_layout(G)  # Positions for all nodes
-
-    # Create a mapping from nodes to communities
-
-    node_to_community = {}
-    for comm in P:
-        for node in comm:
-            node_to_community[node] = comm
-    # print(set(node_to_community.values()), len(set(node_to_community.values())))
-
-    # Assign colors based on communities
-    colors = [hash(frozenset(node_to_community[node])) % len(node_to_community.values()) for node in G.nodes()]
+def draw_partitioned_graph(G, P, path="partition.png"):
+    """
+    Writes a drawing of the partition P of G to an image file, see render.draw_partition.
 
-    nx.draw(G, pos, node_color=colors, with_labels=True)
-    plt.show()
+    Args:
+        G (CSRGraph or nx.Graph): The graph.
+        P (iterable or dict): The communities, as sets of nodes or as a dict from node to community.
+        path (str): The file to write.
 
+    Returns:
+        str: path.
+    """
+    return draw_partition(G, P, path)
 
 if __name__ == "__main__":
     G = nx.karate_club_graph()
@@ -1,8 +1,13 @@
 import networkx as nx
 import numpy as np
-import matplotlib.pyplot as plt
 import math
 
+from csr_graph import CSRGraph
+from merge_sampler import MergeSampler
+from node_queue import NodeQueue
+from quality import Modularity, membership_from_communities, partition_modularity
+from subset_merge import merge_subset, node_total
+
 def singleton_partition(G):
     """
     Create a partition where each node is in its own community.
@@ -47,54 +52,71 @@ def modularity(G, P):
     Calculates the modularity of a partition of a graph.
 
     Args:
-        G (Graph): The graph.
+        G (CSRGraph or Graph): The graph. A networkx graph is converted on every call, so callers that score
+            many partitions should convert it once with CSRGraph.from_networkx.
         P (set): The partition of the graph, where each element is a set representing a community.
 
     Returns:
         float: The modularity of the partition.
     """
-    m = len(G.edges)
-    modularity_value = 0
-    for C in P:
-        L_C = sum(1 for (u, v) in G.edges if u in C and v in C)
-        D_C = sum(sum(1 for (_, v) in G.edges if v in C) for node in C)
-        modularity_value += (L_C / m) - (D_C / (2 * m)) ** 2
-    return modularity_value
+    if not isinstance(G, CSRGraph):
+        G = CSRGraph.from_networkx(G)
+    return partition_modularity(G, membership_from_communities(G, P))
 
-def partition_quality_change(G, P, v, C):
+def community_totals(G, P, quality):
     """
-    Calculates the change in modularity when moving a node to a different community.
+    Sums the node totals of every community, once, so that the changes of moves can be scored in O(1) and
+    the sums kept up to date as nodes move.
 
     Args:
         G (Graph): The graph.
-        P (set): The current partition of the graph.
-        v (frozenset): The node to be moved.
-        C (frozenset): The community to which the node will be moved.
+        P (set): The partition of the graph.
+        quality (Quality): The quality.
 
     Returns:
-        float: The change in modularity.
+        dict: The total of every community of P.
     """
-    # Find the community that currently contains v
-    current_community = next(comm for comm in P if v in comm)
-
-    # Create a new partition without v in its current community
-    new_partition = P.copy()
-    new_partition.remove(current_community)
-    new_partition.add(current_community - {v})
+    return {C: sum(node_total(G, u, quality) for u in C) for C in P}
 
-    # Add v to the target community C
-    if C in new_partition:
-        new_partition.remove(C)
-        new_partition.add(C.union({v}))
-    else:
-        new_partition.add(frozenset({v}))
+def partition_quality_change(G, P, v, C, quality=None, totals=None, current_community=None):
+    """
+    Calculates the change in quality when moving a node to a different community, with quality.move_gain
+    from the edge weight between the node and the two communities and their totals.
 
-    current_modularity = modularity(G, P)
-    new_modularity = modularity(G, new_partition)
-    return new_modularity - current_modularity
+    Args:
+        G (Graph): The graph.
+        P (set): The current partition of the graph.
+        v (frozenset): The node to be moved.
+        C (frozenset): The community to which the node will be moved.
+        quality (Quality, optional): The quality. Defaults to modularity of G.
+        totals (dict, optional): The total of every community of P, see community_totals. Summed over the
+            two communities when not given.
+        current_community (frozenset, optional): The community of P that contains v, looked up when not
+            given.
 
-gamma = 0.5
-# the resolution parameter, controls the size of the communities detected by the algorithm.
+    Returns:
+        float: The change in quality.
+    """
+    if quality is None:
+        quality = Modularity(G.size(weight="weight"))
+    if current_community is None:
+        current_community = next(comm for comm in P if v in comm)
+    if C == current_community:
+        return 0.0
+    if totals is None:
+        totals = community_totals(G, (C, current_community), quality)
+
+    weight_to_new = weight_to_old = 0
+    for u, data in G[v].items():
+        if u != v:
+            if u in C:
+                weight_to_new += data.get("weight", 1)
+            elif u in current_community:
+                weight_to_old += data.get("weight", 1)
+    v_total = node_total(G, v, quality)
+    return quality.move_gain(weight_to_new, weight_to_old, v_total, totals[C], totals[current_community] - v_total)
+
+# gamma, the resolution parameter, controls the size of the communities detected by the algorithm.
 # A higher value of gamma tends to result in smaller, more tightly-knit communities, while a
 # lower value tends to produce larger, more inclusive communities.
 
@@ -105,91 +127,111 @@ theta = 0.1
 # higher value of theta increases the likelihood of accepting moves that result in a smaller
 # increase in partition quality, thereby introducing more randomness into the process.
 
-def merge_nodes_subset(G, P, S):
+def merge_nodes_subset(G, P, S, rng=None, sampler=None, gamma=0.5, quality=None):
     """
-    Refines a given partition of a graph by merging well-connected nodes within a specified subset into communities.
+    Refines a given partition of a graph by merging well-connected nodes within a specified subset into communities,
+    see subset_merge.merge_subset.
 
     Args:
         G (dict): The graph inputted, where keys are nodes and values are dictionaries
                   of neighboring nodes with edge weights.
-        P (dict): The current partition of the graph, where keys are nodes and values are communities.
+        P (set): The refined partition, in which the nodes of S are still singletons.
         S (set): The subset of nodes within which to merge well-connected nodes.
+        rng (np.random.Generator, optional): Source of the random choices. Defaults to a fresh unseeded one.
+        sampler (MergeSampler, optional): Buffers for the choices, reused across calls.
+        gamma (float): The resolution of the well-connectedness checks.
+        quality (Quality, optional): The quality the merges gain in. Defaults to modularity of G.
 
     Returns:
-        dict: The updated partition of the graph after merging well-connected nodes within the subset.
-    """
-    # Calculate the degree of each node and the subset
-    k = {v: len(G[v]) for v in S}
-    k_S = sum(k.values())
-
-    # Consider only nodes that are well connected within the subset
-    R = {v for v in S if sum(1 for u in G[v] if u in S and u != v) >= gamma * k[v] * (k_S - k[v])}
-
-    for v in R:
-        # Consider only nodes that are in singleton communities
-        if frozenset({v}) in P:
-            # Consider only well-connected communities
-            T = {C for C in P if C.issubset(S) and
-                 sum(1 for u in C for w in S - C if w in G[u]) >= gamma * sum(k[u] for u in C) * (k_S - sum(k[u] for u in C))}
-
-            # Choose a random community to move the node to, based on a probability proportional to the change in partition quality
-            delta_hp = {C: partition_quality_change(G, P, v, C) for C in T}
-            prob = {C: np.exp(1 / theta * delta_hp[C]) if delta_hp[C] >= 0 else 0 for C in T}
-            total_prob = sum(prob.values())
-            if total_prob > 0:
-                prob = {C: p / total_prob for C, p in prob.items()}
-                chosen_community = np.random.choice(list(T), p=list(prob.values()))
-                # Update P by removing v from its current community and adding it to the chosen community
-                P.remove({v})
-                P.add(chosen_community | {v})
-
+        set: The updated partition of the graph after merging well-connected nodes within the subset.
+    """
+    if quality is None:
+        quality = Modularity(G.size(weight="weight"))
+    if rng is None:
+        rng = np.random.default_rng()
+    if sampler is None:
+        sampler = MergeSampler(max((d for _, d in G.degree()), default=0) + 1)
+    communities = merge_subset(G, S, quality, rng, sampler, gamma, theta)
+    for v in S:
+        P.discard(frozenset({v}))
+    P.update(frozenset(C) for C in communities)
     return P
 
-def refine_partition(G, P):
+def refine_partition(G, P, rng=None, gamma=0.5, quality=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    sampler = MergeSampler(max((d for _, d in G.degree()), default=0) + 1)
     prefinined = singleton_partition(G)
     for C in P:
-        prefinined = merge_nodes_subset(G, prefinined, C)
+        prefinined = merge_nodes_subset(G, prefinined, C, rng, sampler, gamma, quality)
     return prefinined
 
-def move_nodes_fast(G, P):
+def move_nodes_fast(G, P, quality=None):
     """
     Moves nodes to different communities to improve the partition quality of the graph.
 
     Args:
         G (Graph): The graph for which the partition is being optimized.
         P (set): The current partition of the graph, where each element is a set representing a community.
+        quality (Quality, optional): The quality to optimise. Defaults to modularity of G.
 
     Returns:
         set: The optimized partition of the graph.
     """
-    Q = list(G.nodes)
+    if quality is None:
+        quality = Modularity(G.size(weight="weight"))
+    nodes = list(G.nodes)
+    index = {v: i for i, v in enumerate(nodes)}
+    Q = NodeQueue(len(nodes), range(len(nodes)))
+    totals = community_totals(G, P, quality)
+    totals[frozenset()] = 0
+    community_of = {v: C for C in P for v in C}
     while Q:
-        v = Q.pop(0)
+        v = nodes[Q.pop()]
+        current_community = community_of[v]
+        v_total = node_total(G, v, quality)
+        weight_to = {}
+        for u, data in G[v].items():
+            if u != v:
+                C = community_of[u]
+                weight_to[C] = weight_to.get(C, 0) + data.get("weight", 1)
+        weight_to_old = weight_to.get(current_community, 0)
+        old_total = totals[current_community] - v_total
+        # A community v has no edge to gains at most as much as an empty one, so only the neighbouring
+        # communities and one empty community are candidates
+        weight_to.setdefault(frozenset(), 0)
         best_delta = 0
         best_community = None
-        for C in P.union({frozenset()}):
-            delta = partition_quality_change(G, P, v, C)
-            if delta > best_delta:
-                best_delta = delta
-                best_community = C
+        for C, weight in weight_to.items():
+            if C != current_community:
+                delta = quality.move_gain(weight, weight_to_old, v_total, totals[C], old_total)
+                if delta > best_delta:
+                    best_delta = delta
+                    best_community = C
         if best_delta > 0:
-            # Find the community that currently contains v
-            current_community = next(comm for comm in P if v in comm)
-            # Update the partition
+            # Update the partition, the totals of the two communities and the community of their nodes
+            left = current_community - {v}
+            joined = best_community.union({v})
             P.remove(current_community)
-            P.add(current_community - {v})
+            P.add(left)
+            totals[left] = totals.pop(current_community) - v_total
             if best_community in P:
                 P.remove(best_community)
-                P.add(best_community.union({v}))
-            else:
-                P.add(frozenset({v}))
-            # Update the queue
-            N = {u for (u, _) in G.edges if u not in best_community}
-            Q.extend(list(N - set(Q)))
+            P.add(joined)
+            totals[joined] = totals.pop(best_community) + v_total
+            totals.setdefault(frozenset(), 0)
+            for u in left:
+                community_of[u] = left
+            for u in joined:
+                community_of[u] = joined
+            # Queue the neighbours of v that are not in its new community
+            for u in G[v]:
+                if u not in best_community:
+                    Q.push(index[u])
     return P
 
 
-def Leiden(G, initial_partition=None):
+def Leiden(G, initial_partition=None, seed=None, gamma=0.5, quality=None):
     """
     Executes the Leiden algorithm to detect communities in a graph.
 
@@ -197,6 +239,10 @@ def Leiden(G, initial_partition=None):
         G (Graph): The graph for which communities are to be detected.
         initial_partition (set, optional): An initial partition of the graph. If not provided, a singleton
             partition is used as the starting point.
+        seed (int or np.random.Generator, optional): Seed of the refinement's random choices.
+        gamma (float): The resolution of the refinement's well-connectedness checks.
+        quality (Quality, optional): The quality to optimise, e.g. from quality.make_quality. Defaults to
+            modularity of the graph of each level.
 
     Returns:
         set: The final partition of the graph, where each element is a set representing a community.
@@ -205,15 +251,16 @@ def Leiden(G, initial_partition=None):
         P = singleton_partition(G)
     else:
         P = initial_partition
+    rng = np.random.default_rng(seed)
     done = False
     iters = 0
     while not done:
         print(iters)
         iters += 1
-        P = move_nodes_fast(G, P)
+        P = move_nodes_fast(G, P, quality)
         done = len(P) == len(G.nodes)
         if not done:
-            prefinined = refine_partition(G, P)
+            prefinined = refine_partition(G, P, rng, gamma, quality)
             G = aggregate_graph(G, prefinined)
             P = {frozenset({v for v in C if v in G.nodes}) for C in P}
     return flatten_partition(P)
@@ -1,10 +1,16 @@
-import networkx as nx
 import random
-import math
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 
-from graph_data import GraphData
+from community_scratch import CommunityScratch
+from convergence import Convergence
+from csr_graph import CSRGraph
+from hierarchy import Hierarchy
+from observer import ProfileObserver
+from partition import Partition
+from parallel_moving import LocalMovingPool, move_nodes_parallel
+from quality import CPM, make_quality
+from render import draw_partition
 
 def singleton_partition(G):
     """
@@ -16,198 +22,205 @@ def singleton_partition(G):
     Returns:
         set of frozensets: A partition of the graph where each node is in its own singleton community.
     """
-    return {frozenset({v}) for v in G.nodes()}
+    return {frozenset({v}) for v in G.nodes}
 
 
-class Graph:
+def aggregate_graph(G, P, quality=None):
     """
-    Represents a graph with a set of nodes and edges.
+    Creates an aggregate graph where each community in the partition becomes a node. The edge between two
+    aggregate nodes carries the total weight of the edges between the two communities, the weight inside a
+    community becomes a self-loop, and each aggregate node weighs as much as the nodes it contains.
 
-    Attributes:
-        nodes (set): The set of nodes in the graph.
-        edges (set): The set of edges in the graph, where each edge is represented as a tuple (node1, node2).
+    Args:
+        G (CSRGraph): The original graph.
+        P (Partition): The partition of the graph.
+        quality (Quality, optional): The quality being optimised, whose aggregation rule is used.
+
+    Returns:
+        CSRGraph: The aggregate graph. Aggregate node i is community i of P.renumbered().
     """
+    if quality is None:
+        return G.aggregate(P.renumbered(), len(P))
+    return quality.aggregate(G, P.renumbered(), len(P))
+
 
-    def __init__(self, nodes, edges):
-        """
-        Initializes a new Graph object.
-
-        Args:
-            nodes (set): The set of nodes for the graph.
-            edges (set): The set of edges for the graph, where each edge is represented as a tuple (node1, node2).
-        """
-        self.nodes = nodes
-        self.edges = edges
-        self.G = nx.Graph()
-        # Create a mapping from frozenset nodes to numbers
-        node_labels = {node: list(node)[0] for node in self.nodes}
-        self.G.add_nodes_from(node_labels.values())
-        self.G.add_edges_from([(node_labels[u], node_labels[v]) for u, v in self.edges])
-
-    def __repr__(self):
-        """
-        Returns a string representation of the graph.
-        """
-        return f"Graph(nodes={self.nodes}, edges={self.edges})"
-
-    def draw(self, with_labels=True):
-        """
-        Draws the graph using NetworkX and Matplotlib, displaying only the numbers for each node label.
-        """
-        
-        nx.draw(self.G, node_size=50, with_labels=with_labels, node_color='lightblue')
-        plt.show()
-
-
-def aggregate_graph(G, P):
+
+def move_nodes(G, P, quality=None, pool=None, convergence=None, observer=None):
     """
-    Creates an aggregate graph where each community in the partition becomes a node, and an edge is added between two nodes
-    if there is at least one edge between the corresponding communities in the original graph.
+    Moves single nodes to the community that increases the quality most, until no move helps.
+
+    Rather than re-evaluating the quality for every candidate partition, P keeps the total of every
+    community up to date as nodes move, so scoring a node costs one sweep over its edges plus O(1) per
+    candidate community. The candidates are the communities of the node's neighbours and one empty
+    community: any other community gains less than the empty one, see parallel_moving.score_moves. A
+    sweep over all nodes is therefore O(m).
 
     Args:
-        G (graph): The original graph.
-        P (set): The partition of the graph.
+        G (CSRGraph): The graph.
+        P (Partition): The starting partition, updated in place.
+        quality (Quality, optional): The quality to optimise. Defaults to CPM with gamma = 1/7.
+        pool (LocalMovingPool, optional): Spread the moves over these worker processes, see
+            move_nodes_parallel.
+        convergence (Convergence, optional): When to stop before no move helps.
+        observer (Observer, optional): Told about every pass, see observer.
 
     Returns:
-        Graph: The aggregate graph.
+        Partition: The improved partition.
     """
-    V = P
-    E = set()
-    for (u, v) in G.edges:
-        for C in P:
-            for D in P:
-                if u in C and v in D:
-                    E.add((C, D))
-    return Graph(V, E)
-
-
-
-# num of edges between community C and community D, for instance
-def get_edges_between_two_comms(comm1, comm2, G, P):
-    res = 0
-    # Convert the set of frozensets to a dictionary
-    P_dict = {node: comm for comm in P for node in comm}
-    members1 = [node for node in G.nodes if P_dict[node] == comm1]
-    members2 = [node for node in G.nodes if P_dict[node] == comm2]
-    for node in members1:
-        res += len(set(members2) & set(G[node]))
-    return res
-
-def get_edges_between_communities(G, P):
-    counts = {}
-    for i, k1 in enumerate(P):
-        for j, k2 in enumerate(P):
-            if i <= j:
-                counts[k1, k2] = get_edges_between_two_comms(k1, k2, G, P)
-    return counts
-
-def H(G, P, gamma=1/7):
-    total = 0
-    counts = get_edges_between_communities(G, P)  # E(C,D) in the paper
-    for comm in P:
-        comm_size = len(comm)
-        total += counts[comm, comm] - (gamma * math.comb(comm_size, 2))
-    return total
-
-def maybe_move_node(node, community, P):
-    P_new = set()
-    node_moved = False
-    for comm in P:
-        if node in comm and comm != community:
-            P_new.add(comm - {node})
-        else:
-            P_new.add(comm)
-    for comm in P_new:
-        if comm == community:
-            P_new.remove(comm)
-            P_new.add(comm | {node})
-            node_moved = True
-            break
-    if not node_moved:
-        P_new.add(frozenset({node}))
-    return P_new
-
-
-def move_node(node, community, P):
-    P_new = set()
-    node_moved = False
-    for comm in P:
-        if node in comm and comm != community:
-            P_new.add(comm - {node})
-        else:
-            P_new.add(comm)
-    for comm in P_new:
-        if comm == community:
-            P_new.remove(comm)
-            P_new.add(comm | {node})
-            node_moved = True
-            break
-    if not node_moved:
-        P_new.add(frozenset({node}))
-    return P_new
-
-
-def move_nodes(G, P, gamma=1/7):
-    H_old = H(G, P, gamma)
+    if quality is None:
+        quality = CPM(1/7)
+    if convergence is None:
+        convergence = Convergence()
+    if pool is not None:
+        return move_nodes_parallel(G, P, quality, pool, convergence=convergence, observer=observer)
+    node_totals = quality.node_totals(G)
+    totals = quality.community_totals(P)
+    scratch = CommunityScratch(len(P.community_counts))
+    current = quality(G, P.membership) if convergence.tolerance > 0 else 0.0
+
+    passes = 0
     improvement = True
     while improvement:
         improvement = False
-        for node in G.nodes():
-            best_community = None
-            best_increase = 0
-            for community in P.union({frozenset()}):
-                P_new = maybe_move_node(node, community, P)
-                increase = H(G, P_new, gamma) - H_old
+        gain = 0.0
+        moves = 0
+        started = time.perf_counter()
+        for node in G.nodes:
+            if convergence.expired():
+                # Out of time: end with this partial pass
+                improvement = False
+                break
+            old = P.community_of(node)
+            communities, weights = scratch.gather(G, P.membership, node)
+            node_total = node_totals[node]
+            weight_to_old = weights[communities.index(old)] if old in communities else 0.0
+            old_total = totals[old] - node_total
+            best_community = P.get_empty_community()
+            best_increase = quality.move_gain(0.0, weight_to_old, node_total, 0.0, old_total)
+            for community, weight in zip(communities, weights):
+                if community == old:
+                    continue
+                increase = quality.move_gain(weight, weight_to_old, node_total, totals[community], old_total)
                 if increase > best_increase:
                     best_increase = increase
                     best_community = community
+
             if best_increase > 0:
-                P = move_node(node, best_community, P)
-                H_old = H(G, P, gamma)
+                P.move_node(node, best_community)
+                gain += best_increase
+                moves += 1
                 improvement = True
+        passes += 1
+        stop = improvement and convergence.stop_pass(passes, gain, current)
+        if observer is not None:
+            observer.on_pass({
+                "pass": passes, "moves": moves, "gain": gain, "queue": len(G) if improvement and not stop else 0,
+                "seconds": time.perf_counter() - started,
+            })
+        if stop:
+            break
+        current += gain
     return P
 
-def draw_partitioned_graph(G, P):
-    pos = nx.spring_layout(G)  # Positions for all nodes
-
-    # Create a mapping from nodes to communities
-    node_to_community = {node: comm for comm in P for node in comm}
-
-    # Assign colors based on communities
-    colors = [hash(node_to_community[node]) % 256 for node in G.nodes()]
+def draw_partitioned_graph(G, P, path="partition.png"):
+    """
+    Writes a drawing of the partition P of G to an image file, see render.draw_partition.
 
-    nx.draw(G, pos, node_color=colors, with_labels=True)
-    plt.show()
+    Args:
+        G (CSRGraph or nx.Graph): The graph.
+        P (iterable or dict): The communities, as sets of nodes or as a dict from node to community.
+        path (str): The file to write.
 
+    Returns:
+        str: path.
+    """
+    return draw_partition(G, P, path)
 
 def flattened(P):
     return set(frozenset.union(*P))
 
-def Louvain(G, P):
-    done = False
-    iteration = 0
-    while not done:
-        P = move_nodes(G, P)
-        print(f"Iteration {iteration}:")
-        draw_partitioned_graph(G, P)
-        done = len(P) == len(G.nodes())  # Terminate when each community consists of only one node
-        if not done:
-            G = aggregate_graph(G, P)
-            P = singleton_partition(G)
-        iteration += 1
-    return flattened(P)
+def Louvain(G, P, quality="cpm", gamma=None, workers=1, return_hierarchy=False, convergence=None, observer=None):
+    """
+    Runs the Louvain algorithm.
+
+    Args:
+        G (CSRGraph or nx.Graph): The graph.
+        P (Partition or set): The starting partition.
+        quality (str or Quality): The quality to optimise, see make_quality.
+        gamma (float, optional): The resolution parameter when quality is given by name.
+        workers (int): Number of processes for local moving; 1 runs it serially.
+        return_hierarchy (bool): Return the Hierarchy of the run instead, whose resolve() gives the
+            communities of any level for the nodes of G.
+        convergence (Convergence, optional): Stopping rules; its clock starts here. By default the run
+            continues until a level changes nothing.
+        observer (Observer, optional): Told about every pass and level, see observer. By default the run is
+            silent.
+
+    Returns:
+        set: The nodes of the final aggregate graph, one per community.
+    """
+    if not isinstance(G, CSRGraph):
+        G = CSRGraph.from_networkx(G)
+        index = {label: i for i, label in enumerate(G.labels)}
+        P = {frozenset(index[v] for v in comm) for comm in P}
+    if not isinstance(P, Partition):
+        P = Partition.from_sets(G, P)
+    quality = make_quality(G, quality, gamma)
+    convergence = (Convergence() if convergence is None else convergence).start()
+    hierarchy = Hierarchy()
+    pool = LocalMovingPool(workers) if workers > 1 else None
+    if observer is not None:
+        run_started = time.perf_counter()
+        observer.on_start({"algorithm": "louvain", "nodes": len(G), "edges": G.number_of_edges()})
+    try:
+        done = False
+        iteration = 0
+        while not done:
+            started = time.perf_counter()
+            P = move_nodes(G, P, quality, pool, convergence, observer)
+            seconds = {"move": time.perf_counter() - started}
+            # Terminate when each community consists of only one node, or when the stopping rules say so
+            done = len(P) == len(G.nodes) or convergence.stop_level(iteration + 1)
+            level = {"level": iteration, "nodes": len(G), "communities": len(P)}
+            if observer is not None:
+                level["quality"] = float(quality(G, P.membership))
+            if not done:
+                started = time.perf_counter()
+                hierarchy.append(P.renumbered())
+                G = aggregate_graph(G, P, quality)
+                P = Partition.singleton(G)
+                seconds["aggregate"] = time.perf_counter() - started
+            if observer is not None:
+                observer.on_level({**level, "seconds": seconds})
+            iteration += 1
+    finally:
+        if pool is not None:
+            pool.close()
+    if not hierarchy or len(P) < len(G):
+        hierarchy.append(P.renumbered())
+    if observer is not None:
+        observer.on_end({
+            "levels": iteration, "communities": len(P), "quality": float(quality(G, P.membership)),
+            "seconds": time.perf_counter() - run_started,
+        })
+    if return_hierarchy:
+        return hierarchy
+    return flattened(P.to_sets())
 
 
 if __name__ == "__main__":
+    from graph_data import GraphData
+
     # G = nx.karate_club_graph()
     G = GraphData()
 
-    P = singleton_partition(G.G)
+    G = CSRGraph.from_graph_data(G)
+
+    P = singleton_partition(G)
     # print(P)
-    
-    agg_graph = aggregate_graph(G.G,P)
 
     # G.draw(h=True)
-    # agg_graph.draw()
-    
-    Louvain(G.G, P)
\ No newline at end of file
+
+    profile = ProfileObserver()
+    Louvain(G, P, observer=profile)
+    print(profile.report())
\ No newline at end of file
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class MergeSampler:
+    """
+    Randomised choice of the cluster a node merges into during Leiden refinement, where cluster C is picked
+    with probability proportional to exp(gain(C) / theta) among the candidates with a non-negative gain.
+
+    The candidates are collected in preallocated buffers, and the choice is made from the cumulative sums
+    of exp((gain - max gain) / theta), the log-sum-exp normalisation, which cannot overflow. No memory is
+    allocated per choice.
+
+    Attributes:
+        size (int): Number of candidates added since the last clear().
+    """
+
+    def __init__(self, capacity):
+        """
+        Initializes a new MergeSampler.
+
+        Args:
+            capacity (int): Most candidates a single choice can have, e.g. the maximum degree plus one.
+        """
+        capacity = max(capacity, 1)
+        self._communities = np.empty(capacity, dtype=np.int64)
+        self._gains = np.empty(capacity, dtype=np.float64)
+        self._weights = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def clear(self):
+        self.size = 0
+
+    def add(self, community, gain):
+        """
+        Adds a candidate. Candidates with a negative gain are never chosen and are dropped.
+
+        Args:
+            community (int): The cluster id.
+            gain (float): The quality gain of merging into it.
+        """
+        if gain < 0:
+            return
+        self._communities[self.size] = community
+        self._gains[self.size] = gain
+        self.size += 1
+
+    def sample(self, theta, rng):
+        """
+        Chooses one of the candidates.
+
+        Args:
+            theta (float): The randomness; near 0 the best candidate is almost always chosen.
+            rng (np.random.Generator): The random number generator.
+
+        Returns:
+            int: The chosen cluster id, or None when there are no candidates.
+        """
+        k = self.size
+        if k == 0:
+            return None
+        gains = self._gains[:k]
+        weights = self._weights[:k]
+        np.subtract(gains, gains.max(), out=weights)
+        np.multiply(weights, 1 / theta, out=weights)
+        np.exp(weights, out=weights)
+        np.cumsum(weights, out=weights)
+        # The best candidate has weight exp(0) = 1, so the total is at least 1
+        i = int(np.searchsorted(weights, rng.random() * weights[k - 1], side="right"))
+        return int(self._communities[min(i, k - 1)])
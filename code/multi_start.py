@@ -0,0 +1,121 @@
+"""
+Independent restarts of the Leiden algorithm (leiden2), keeping the best partition.
+
+Every restart gets its own random stream, spawned from one seed with np.random.SeedSequence, which orders its
+node visits and drives its refinement. The restarts run concurrently in a process pool that maps the graph
+from one shared memory block, or straight from a graph file, so with as many cores as restarts they take about as long as a single run.
+"""
+import time
+
+import numpy as np
+
+from csr_graph import CSRGraph
+from parallel_moving import process_pool, share_graph, worker_graph
+from partition import Partition
+
+
+def run_record(G, quality, hierarchy, levels, index=0, wall_time=None):
+    """
+    The statistics of one Leiden run, as multi_start reports them for every restart.
+
+    Args:
+        G (CSRGraph): The graph.
+        quality (Quality): The quality optimised.
+        hierarchy (Hierarchy): The hierarchy of the run.
+        levels (int): Number of levels run_leiden ran.
+        index (int): Index of the restart.
+        wall_time (float, optional): Seconds the run took.
+
+    Returns:
+        dict: The start index, quality, communities, levels and wall_time.
+    """
+    final = hierarchy.resolve()
+    return {
+        "start": index,
+        "quality": float(quality(G, final)),
+        "communities": int(final.max(initial=-1)) + 1,
+        "levels": levels,
+        "wall_time": wall_time,
+    }
+
+
+def run_starts(G, starts, membership, quality, convergence=None):
+    """
+    Runs Leiden once per random stream, one after the other.
+
+    Args:
+        G (CSRGraph or tuple): The graph, or the SharedArrays.spec of the graph shared by share_graph.
+        starts (list): (index, np.random.SeedSequence) of every restart to run.
+        membership (np.ndarray, optional): The starting partition; singletons when None.
+        quality (Quality): The quality to optimise.
+        convergence (Convergence, optional): Stopping rules, started anew for every restart.
+
+    Returns:
+        list of tuple: (P, hierarchy, record) per restart, as returned by multi_start.
+    """
+    from leiden2 import run_leiden
+
+    if not isinstance(G, CSRGraph):
+        G = worker_graph(G)
+    results = []
+    for index, seed_sequence in starts:
+        P = Partition.singleton(G) if membership is None else Partition(G, membership)
+        start = time.perf_counter()
+        if convergence is not None:
+            convergence.start()
+        P, hierarchy, levels = run_leiden(G, P, quality, np.random.default_rng(seed_sequence), convergence=convergence)
+        results.append((P, hierarchy, run_record(G, quality, hierarchy, levels, index, time.perf_counter() - start)))
+    return results
+
+
+def multi_start(G, quality, n_starts=10, membership=None, seed=None, workers=1, convergence=None, shared=None):
+    """
+    Runs Leiden n_starts times with independent random streams and keeps the run of the highest quality.
+
+    The streams only depend on seed, so the result does not depend on the number of workers.
+
+    Args:
+        G (CSRGraph): The graph.
+        quality (Quality): The quality to optimise.
+        n_starts (int): Number of restarts.
+        membership (np.ndarray, optional): The partition every restart starts from; singletons when None.
+        seed (int, optional): Seed the restarts' streams are spawned from.
+        workers (int): Number of processes; 1 runs every restart in this process.
+        convergence (Convergence, optional): Stopping rules, whose time limit applies to every restart.
+        shared (SharedArrays, optional): G as already shared by share_graph, so that the processes of several
+            calls map one copy; it stays open. By default G is shared for this call only, and a graph
+            memory-mapped from a file is mapped by the processes rather than copied.
+
+    Returns:
+        tuple: (P, hierarchy, records). P and hierarchy are as returned by run_leiden for the best restart,
+            the first one on ties. records has one dict per restart, in order, with its start index,
+            quality, communities, levels run by run_leiden and wall_time in seconds, and best, True for the
+            restart returned.
+    """
+    starts = list(enumerate(np.random.SeedSequence(seed).spawn(n_starts)))
+    workers = max(1, min(workers, n_starts))
+    if workers == 1:
+        results = run_starts(G, starts, membership, quality, convergence)
+    else:
+        owned = shared is None
+        if owned:
+            shared = share_graph(G)
+        pool = process_pool(workers)
+        try:
+            chunks = [starts[i::workers] for i in range(workers)]
+            results = [result for chunk in pool.starmap(run_starts, [
+                (shared.spec, chunk, membership, quality, convergence) for chunk in chunks
+            ]) for result in chunk]
+        finally:
+            pool.terminate()
+            pool.join()
+            if owned:
+                shared.close()
+        results.sort(key=lambda result: result[2]["start"])
+
+    best = max(range(len(results)), key=lambda i: (results[i][2]["quality"], -i))
+    records = [record for _, _, record in results]
+    for i, record in enumerate(records):
+        record["best"] = i == best
+    P, hierarchy, _ = results[best]
+    return P, hierarchy, records
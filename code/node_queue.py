@@ -0,0 +1,66 @@
+import numpy as np
+
+
+class NodeQueue:
+    """
+    FIFO queue of node ids in which every node appears at most once, as used by the fast local moving
+    of the Leiden algorithm.
+
+    The queue is a ring buffer with one slot per node, and a bitmap records which nodes are queued, so
+    push, pop and membership tests are all O(1).
+
+    Attributes:
+        in_queue (np.ndarray): bool flag per node, True while the node is waiting in the queue.
+    """
+
+    def __init__(self, n, nodes=()):
+        """
+        Initializes a new NodeQueue.
+
+        Args:
+            n (int): Number of nodes; node ids are 0..n-1.
+            nodes (iterable, optional): Nodes to queue initially, in order.
+        """
+        self._buffer = np.empty(max(n, 1), dtype=np.int32)
+        self.in_queue = np.zeros(n, dtype=bool)
+        self._head = 0
+        self._size = 0
+        for v in nodes:
+            self.push(v)
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __contains__(self, v):
+        return bool(self.in_queue[v])
+
+    def push(self, v):
+        """
+        Adds v at the back of the queue unless it is already queued.
+
+        Args:
+            v (int): A node id.
+        """
+        if self.in_queue[v]:
+            return
+        self.in_queue[v] = True
+        self._buffer[(self._head + self._size) % len(self._buffer)] = v
+        self._size += 1
+
+    def pop(self):
+        """
+        Removes and returns the node at the front of the queue.
+
+        Returns:
+            int: A node id.
+        """
+        if not self._size:
+            raise IndexError("pop from an empty NodeQueue")
+        v = int(self._buffer[self._head])
+        self._head = (self._head + 1) % len(self._buffer)
+        self._size -= 1
+        self.in_queue[v] = False
+        return v
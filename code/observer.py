@@ -0,0 +1,183 @@
+"""
+Progress events of the Louvain and Leiden runs, and sinks that record them.
+
+The algorithms take an optional observer. Without one they build no events and take no extra measurements,
+so a run is silent and costs the same as before. With one, they report:
+
+    start: algorithm (str), nodes (int), edges (int), once per run.
+    pass: pass (int), moves (int), gain (float), queue (int) and seconds (float), after every pass of local
+        moving. queue is the number of nodes still waiting to be visited, 0 when local moving ends.
+    level: level (int), nodes (int), communities (int), quality (float) and seconds (dict of phase name to
+        seconds, for "move", "refine" and "aggregate"), after every level.
+    end: levels (int), communities (int), quality (float) and seconds (float), once per run.
+"""
+import json
+import time
+
+
+class Observer:
+    """
+    Receives the progress events of a run, each a dict as described in the module docstring. The methods do
+    nothing; subclasses override the ones they need.
+    """
+
+    def on_start(self, event):
+        pass
+
+    def on_pass(self, event):
+        pass
+
+    def on_level(self, event):
+        pass
+
+    def on_end(self, event):
+        pass
+
+
+class ObserverGroup(Observer):
+    """
+    Passes every event on to several observers, in order.
+    """
+
+    def __init__(self, *observers):
+        """
+        Initializes a new ObserverGroup.
+
+        Args:
+            *observers (Observer): The observers.
+        """
+        self.observers = observers
+
+    def on_start(self, event):
+        for observer in self.observers:
+            observer.on_start(event)
+
+    def on_pass(self, event):
+        for observer in self.observers:
+            observer.on_pass(event)
+
+    def on_level(self, event):
+        for observer in self.observers:
+            observer.on_level(event)
+
+    def on_end(self, event):
+        for observer in self.observers:
+            observer.on_end(event)
+
+
+class JSONLinesObserver(Observer):
+    """
+    Writes every event as one line of JSON, with its kind under "event". Pass events also get the level they
+    belong to.
+    """
+
+    def __init__(self, file):
+        """
+        Initializes a new JSONLinesObserver.
+
+        Args:
+            file (str or file): A path to write to, or an open text file, which is left open.
+        """
+        self._owned = isinstance(file, str)
+        self.file = open(file, "w") if self._owned else file
+        self._level = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Closes the file if this observer opened it.
+        """
+        if self._owned:
+            self.file.close()
+
+    def _write(self, kind, event):
+        self.file.write(json.dumps({"event": kind, **event}) + "\n")
+
+    def on_start(self, event):
+        self._level = 0
+        self._write("start", event)
+
+    def on_pass(self, event):
+        self._write("pass", {"level": self._level, **event})
+
+    def on_level(self, event):
+        self._level = event["level"] + 1
+        self._write("level", event)
+
+    def on_end(self, event):
+        self._write("end", event)
+        self.file.flush()
+
+
+class ProfileObserver(Observer):
+    """
+    Adds up the events of one or more runs: the time spent in every phase, and the number of levels, passes
+    and moves.
+
+    Attributes:
+        runs (int): Number of runs started.
+        levels (int): Number of levels.
+        passes (int): Number of passes of local moving.
+        moves (int): Number of node moves.
+        phases (dict): Seconds spent per phase, "move", "refine" and "aggregate".
+        total (float): Seconds from the start to the end of the runs.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new ProfileObserver.
+        """
+        self.runs = 0
+        self.levels = 0
+        self.passes = 0
+        self.moves = 0
+        self.phases = {"move": 0.0, "refine": 0.0, "aggregate": 0.0}
+        self.total = 0.0
+        self._started = None
+
+    def on_start(self, event):
+        self.runs += 1
+        self._started = time.perf_counter()
+
+    def on_pass(self, event):
+        self.passes += 1
+        self.moves += event["moves"]
+
+    def on_level(self, event):
+        self.levels += 1
+        for phase, seconds in event["seconds"].items():
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def on_end(self, event):
+        self.total += event["seconds"]
+
+    def summary(self):
+        """
+        Returns:
+            dict: The runs, levels, passes, moves, the seconds per phase under "phases", and the total seconds.
+        """
+        return {
+            "runs": self.runs,
+            "levels": self.levels,
+            "passes": self.passes,
+            "moves": self.moves,
+            "phases": dict(self.phases),
+            "total": self.total,
+        }
+
+    def report(self):
+        """
+        Returns:
+            str: The summary as a small table, one line per phase with its share of the total time.
+        """
+        lines = [f"{self.runs} run(s), {self.levels} levels, {self.passes} passes, {self.moves} moves, "
+                 f"{self.total:.3f}s"]
+        for phase, seconds in self.phases.items():
+            share = seconds / self.total if self.total > 0 else 0.0
+            lines.append(f"{phase:>10} {seconds:>9.3f}s {share:>6.1%}")
+        return "\n".join(lines)
@@ -0,0 +1,472 @@
+import mmap
+import multiprocessing
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from convergence import Convergence
+from csr_graph import CSRGraph
+
+
+class SharedArrays:
+    """
+    Numpy arrays laid out in one multiprocessing.shared_memory block, so that worker processes can map them
+    without copying. Arrays memory-mapped from a file as a whole, like those of graph_file.open_graph, are
+    not copied into the block; the workers map the same file region instead.
+
+    Attributes:
+        arrays (dict): name -> np.ndarray view of the shared block or of the file, the former writable by
+            the owner.
+        spec (tuple): What a worker needs to map the same arrays with attach().
+    """
+
+    def __init__(self, arrays):
+        """
+        Creates the block and copies the arrays that are not file-backed into it.
+
+        Args:
+            arrays (dict): name -> array to share.
+        """
+        layout = []
+        offset = 0
+        for name, array in arrays.items():
+            region = _file_region(array)
+            if region is not None:
+                layout.append((name, array.dtype.str, array.shape, region[1], region[0]))
+                continue
+            array = np.asarray(array)
+            layout.append((name, array.dtype.str, array.shape, offset, None))
+            offset += -(-array.nbytes // 8) * 8
+        self._shm = shared_memory.SharedMemory(create=True, size=offset) if offset else None
+        self.spec = (self._shm.name if self._shm is not None else None, tuple(layout))
+        self.arrays = self._views(self._shm, layout)
+        for name, _, _, _, path in layout:
+            if path is None:
+                self.arrays[name][...] = arrays[name]
+
+    @staticmethod
+    def _views(shm, layout):
+        return {
+            name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset) if path is None
+            else np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=offset, shape=shape)
+            for name, dtype, shape, offset, path in layout
+        }
+
+    @staticmethod
+    def attach(spec):
+        """
+        Maps the arrays of a block created in another process.
+
+        Returns:
+            tuple: (shm, arrays); keep shm referenced for as long as the arrays are used. shm is None when
+                every array is file-backed.
+        """
+        name, layout = spec
+        shm = shared_memory.SharedMemory(name=name) if name is not None else None
+        return shm, SharedArrays._views(shm, layout)
+
+    def close(self):
+        self.arrays = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+
+
+def _file_region(array):
+    """
+    Returns:
+        tuple: (path, offset) of the file region array maps, when it is an np.memmap of the whole region, or
+            a plain view of all of one as CSRGraph keeps it, else None.
+    """
+    mapped = array
+    while isinstance(mapped, np.ndarray) and not isinstance(mapped.base, mmap.mmap):
+        mapped = mapped.base
+    if (
+        isinstance(mapped, np.memmap) and mapped.filename is not None and array.dtype == mapped.dtype
+        and array.flags.c_contiguous and array.ctypes.data == mapped.ctypes.data and array.nbytes == mapped.nbytes
+    ):
+        return mapped.filename, mapped.offset
+    return None
+
+
+# The blocks a worker process currently has mapped, one per slot, each reused until a block of another spec
+# takes its slot, and the graph built over the "graph" block by worker_graph
+_attached = {}
+
+
+def worker_arrays(spec, slot="graph"):
+    """
+    Maps the SharedArrays block of the given spec in a worker process, once per block.
+
+    Args:
+        spec (tuple): SharedArrays.spec of the block.
+        slot (str): What the block holds. A worker keeps one block per slot mapped, so that the graph and the
+            partition state of local moving are mapped side by side.
+
+    Returns:
+        dict: name -> np.ndarray view of the shared block.
+    """
+    if slot not in _attached or _attached[slot][0] != spec:
+        if slot == "graph":
+            _attached.pop("csr", None)
+        if slot in _attached:
+            _, shm, arrays = _attached.pop(slot)
+            del arrays
+            if shm is not None:
+                shm.close()
+        shm, arrays = SharedArrays.attach(spec)
+        _attached[slot] = (spec, shm, arrays)
+    return _attached[slot][2]
+
+
+def share_graph(G):
+    """
+    Shares the arrays of a graph for worker_graph, copying them into shared memory unless they are
+    memory-mapped from a graph file.
+
+    Args:
+        G (CSRGraph): The graph.
+
+    Returns:
+        SharedArrays: The block; its owner closes it once the workers are done.
+    """
+    return SharedArrays({
+        "indptr": G.indptr,
+        "indices": G.indices,
+        "weights": G.weights,
+        "node_weights": G.node_weights,
+    })
+
+
+def worker_graph(spec):
+    """
+    The graph shared by share_graph, as seen from a worker process. It is built once per block and reads the
+    shared arrays in place.
+
+    Args:
+        spec (tuple): SharedArrays.spec of the block.
+
+    Returns:
+        CSRGraph: The graph, without labels.
+    """
+    if "csr" not in _attached or _attached["csr"][0] != spec:
+        arrays = worker_arrays(spec)
+        G = CSRGraph(arrays["indptr"], arrays["indices"], arrays["weights"], arrays["node_weights"])
+        _attached["csr"] = (spec, G)
+    return _attached["csr"][1]
+
+
+def propose_moves(graph_spec, spec, quality, nodes):
+    """
+    score_moves on the arrays of two SharedArrays blocks, in a worker process.
+
+    Args:
+        graph_spec (tuple): SharedArrays.spec of the graph, as shared by share_graph.
+        spec (tuple): SharedArrays.spec of the node_totals, membership and totals arrays.
+        quality (Quality): The quality being optimised.
+        nodes (np.ndarray): The node ids to score.
+
+    Returns:
+        tuple: As returned by score_moves.
+    """
+    return score_moves({**worker_arrays(graph_spec), **worker_arrays(spec, "state")}, quality, nodes)
+
+
+def score_moves(arrays, quality, nodes):
+    """
+    Finds the best move of every given node against the membership and community totals of arrays,
+    without applying any of them.
+
+    For a community the node has no edge to, the gain is minus the null model weight between the node and
+    that community's total, so an empty community is always at least as good. The best move is therefore
+    among the neighbouring communities and one empty community, and only those are scored. All the nodes
+    are scored together, in array operations over their edges.
+
+    Args:
+        arrays (dict): The indptr, indices, weights, node_totals, membership and totals arrays.
+        quality (Quality): The quality being optimised.
+        nodes (np.ndarray): The node ids to score.
+
+    Returns:
+        tuple: (nodes, targets, weights_to_new, weights_to_old) of the nodes with an improving move: the
+            best community of each, -1 standing for an empty community, and the node's edge weight to it and
+            to the rest of its own community.
+    """
+    indptr, indices, weights = arrays["indptr"], arrays["indices"], arrays["weights"]
+    node_totals, membership, totals = arrays["node_totals"], arrays["membership"], arrays["totals"]
+    nodes = np.asarray(nodes, dtype=np.int64)
+
+    # The edges of all the nodes at once, each with the position of its node in nodes
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    owner = np.repeat(np.arange(len(nodes)), counts)
+    edges = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(len(owner))
+    neighbors = indices[edges]
+    not_loop = neighbors != nodes[owner]
+    owner, neighbors, edges = owner[not_loop], neighbors[not_loop], edges[not_loop]
+
+    # Edge weight of every (node, neighbouring community) pair, in node order then community order
+    n_slots = len(totals)
+    pairs, inverse = np.unique(owner * n_slots + membership[neighbors], return_inverse=True)
+    weight_to = np.bincount(inverse, weights=weights[edges], minlength=len(pairs))
+    pair_owner = pairs // n_slots
+    pair_community = pairs % n_slots
+
+    old = membership[nodes]
+    node_total = node_totals[nodes]
+    old_total = totals[old] - node_total
+    is_old = pair_community == old[pair_owner]
+    weight_to_old = np.bincount(pair_owner[is_old], weights=weight_to[is_old], minlength=len(nodes))
+
+    best_gain = quality.move_gain(0.0, weight_to_old, node_total, 0.0, old_total)
+    best_community = np.full(len(nodes), -1, dtype=np.int64)
+    best_weight = np.zeros(len(nodes))
+    if len(pairs):
+        gains = quality.move_gain(weight_to, weight_to_old[pair_owner], node_total[pair_owner],
+                                  totals[pair_community], old_total[pair_owner])
+        gains[is_old] = -np.inf
+        # The first best community of every node, as pairs are sorted by community within a node
+        order = np.lexsort((-gains, pair_owner))
+        first = order[np.r_[True, pair_owner[order][1:] != pair_owner[order][:-1]]]
+        better = gains[first] >= best_gain[pair_owner[first]]
+        first = first[better]
+        best_gain[pair_owner[first]] = gains[first]
+        best_community[pair_owner[first]] = pair_community[first]
+        best_weight[pair_owner[first]] = weight_to[first]
+    move = best_gain > 0
+    return nodes[move], best_community[move], best_weight[move], weight_to_old[move]
+
+
+def process_pool(workers):
+    """
+    Starts a multiprocessing.Pool for work on SharedArrays blocks, forking where the platform allows.
+
+    Args:
+        workers (int): Number of worker processes.
+
+    Returns:
+        multiprocessing.pool.Pool: The pool; the caller terminates it.
+    """
+    # Workers must share this process's resource tracker, or each would start its own and unlink the
+    # shared blocks it saw when it exits
+    resource_tracker.ensure_running()
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    return context.Pool(workers)
+
+
+# Fewest nodes sent to a worker in one task, and most nodes of a colour class scored in the parent instead,
+# where a round trip to the workers would take longer than the scoring
+MIN_BLOCK = 1024
+
+
+class LocalMovingPool:
+    """
+    A pool of worker processes for parallel local moving, used as a context manager.
+
+    Attributes:
+        workers (int): Number of worker processes.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._pool = process_pool(workers)
+        self._graph = None
+        self._shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+        self._release()
+
+    def _release(self):
+        if self._shared is not None:
+            self._shared.close()
+        self._graph = self._shared = None
+
+    def share(self, G):
+        """
+        Shares graph G with the workers, see share_graph. The graph stays shared until another graph is or
+        the pool closes, so every call of a run on the same graph reuses one copy, and a graph file is
+        mapped by the workers rather than copied at all.
+
+        Returns:
+            tuple: The SharedArrays.spec of the graph.
+        """
+        if self._graph is not G:
+            self._release()
+            self._shared = share_graph(G)
+            self._graph = G
+        return self._shared.spec
+
+    def propose(self, G, spec, quality, nodes):
+        """
+        Scores the given nodes of graph G across the workers.
+
+        Args:
+            G (CSRGraph): The graph, shared with share() on first use.
+            spec (tuple): SharedArrays.spec of the node_totals, membership and totals arrays.
+            quality (Quality): The quality being optimised.
+            nodes (np.ndarray): The node ids to score.
+
+        Returns:
+            tuple: (nodes, targets, weights_to_new, weights_to_old) as returned by score_moves, sorted by
+                node id.
+        """
+        blocks = np.array_split(nodes, max(min(4 * self.workers, len(nodes) // MIN_BLOCK), 1))
+        graph_spec = self.share(G)
+        results = self._pool.starmap(propose_moves, [
+            (graph_spec, spec, quality, block) for block in blocks if len(block)
+        ])
+        if not results:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+        columns = [np.concatenate(column) for column in zip(*results)]
+        order = np.argsort(columns[0], kind="stable")
+        return tuple(column[order] for column in columns)
+
+
+def colour_classes(G, seed=0):
+    """
+    Splits the nodes into independent sets, no two nodes of a set adjacent, by Jones-Plassmann colouring with
+    random priorities: each round takes the uncoloured nodes whose priority beats that of all their uncoloured
+    neighbours.
+
+    Args:
+        G (CSRGraph): The graph.
+        seed (int): Seed of the priorities, so that the classes are reproducible.
+
+    Returns:
+        list of np.ndarray: The node ids of every colour, each sorted.
+    """
+    n = len(G)
+    priority = np.random.default_rng(seed).permutation(n)
+    sources = np.repeat(np.arange(n), np.diff(G.indptr))
+    targets = G.indices.astype(np.int64)
+    not_loop = sources != targets
+    sources, targets = sources[not_loop], targets[not_loop]
+    colour = np.full(n, -1, dtype=np.int64)
+    c = 0
+    while (colour < 0).any():
+        neighbor_max = np.full(n, -1, dtype=np.int64)
+        np.maximum.at(neighbor_max, sources, priority[targets])
+        colour[(colour < 0) & (priority > neighbor_max)] = c
+        c += 1
+        uncoloured = (colour[sources] < 0) & (colour[targets] < 0)
+        sources, targets = sources[uncoloured], targets[uncoloured]
+    order = np.argsort(colour, kind="stable")
+    return np.split(order, np.flatnonzero(np.diff(colour[order])) + 1)
+
+
+def move_nodes_parallel(G, P, quality, pool, fast=False, nodes=None, convergence=None, observer=None):
+    """
+    Local moving with colouring-based scheduling over a LocalMovingPool.
+
+    The nodes are split into colour classes of non-adjacent nodes, see colour_classes. The classes are swept
+    one after the other. For each, the workers score its active nodes against the partition in shared memory,
+    or the parent does when there are at most MIN_BLOCK of them. The graph is shared once per pool, see
+    LocalMovingPool.share, and only the partition state is copied per call. They report the nodes with an improving move,
+    with the best community and the node's edge weights to it and to its own community. As no two nodes of a
+    class are adjacent, the moves within a class only affect each other through the community totals, so
+    those edge weights stay exact. The parent re-checks every proposed move in node order with one O(1)
+    move_gain against the current totals, applies the ones that still gain, and writes only the membership
+    and totals they changed back to shared memory. Nodes whose move no longer gains are scored again in the
+    next sweep. The result does not depend on the number of workers or
+    their timing.
+
+    Args:
+        G (CSRGraph): The graph.
+        P (Partition): The partition, updated in place.
+        quality (Quality): The quality to optimise.
+        pool (LocalMovingPool): The workers.
+        fast (bool): Only rescore the neighbours of moved nodes after the first sweep, like the queue of the
+            Leiden fast local moving, instead of every node in every sweep like Louvain.
+        nodes (array-like, optional): With fast, only score these nodes in the first sweep.
+        convergence (Convergence, optional): When to stop before no move helps. A sweep over all the classes
+            counts as one pass, and the time limit is checked before every class.
+        observer (Observer, optional): Told about every sweep over all the classes, see observer.
+
+    Returns:
+        Partition: The improved partition.
+    """
+    if convergence is None:
+        convergence = Convergence()
+    node_totals = quality.node_totals(G)
+    totals = quality.community_totals(P)
+    shared = SharedArrays({"node_totals": node_totals, "membership": P.membership, "totals": totals})
+    arrays = {"indptr": G.indptr, "indices": G.indices, "weights": G.weights, **shared.arrays}
+    try:
+        classes = colour_classes(G)
+        if fast and nodes is not None:
+            active = np.zeros(len(G), dtype=bool)
+            active[np.asarray(nodes, dtype=np.int64)] = True
+        else:
+            active = np.ones(len(G), dtype=bool)
+        current = quality(G, P.membership) if convergence.tolerance > 0 else 0.0
+        passes = 0
+        while active.any():
+            moved = []
+            gain = 0.0
+            started = time.perf_counter()
+            expired = False
+            for members in classes:
+                expired = convergence.expired()
+                if expired:
+                    break
+                members = members[active[members]]
+                if not len(members):
+                    continue
+                active[members] = False
+                if len(members) <= MIN_BLOCK:
+                    proposed = score_moves(arrays, quality, members)
+                else:
+                    proposed = pool.propose(G, shared.spec, quality, members)
+                movers, targets, weights_to_new, weights_to_old = proposed
+                applied = []
+                for v, target, weight_to_new, weight_to_old in zip(movers.tolist(), targets.tolist(),
+                                                                   weights_to_new.tolist(), weights_to_old.tolist()):
+                    node_total = node_totals[v]
+                    new_total = 0.0 if target < 0 else totals[target]
+                    move_gain = quality.move_gain(weight_to_new, weight_to_old, node_total, new_total,
+                                                  totals[P.community_of(v)] - node_total)
+                    if move_gain > 0:
+                        P.move_node(v, P.get_empty_community() if target < 0 else target)
+                        gain += move_gain
+                        applied.append(v)
+                    else:
+                        # Outdone by an earlier move of the class; score the node again in the next sweep
+                        active[v] = True
+                if applied:
+                    applied = np.array(applied, dtype=np.int64)
+                    membership = shared.arrays["membership"]
+                    communities = np.union1d(membership[applied], P.membership[applied])
+                    membership[applied] = P.membership[applied]
+                    shared.arrays["totals"][communities] = totals[communities]
+                    moved.extend(applied.tolist())
+            passes += 1
+            stop = expired or not moved or convergence.stop_pass(passes, gain, current)
+            if not stop:
+                if fast:
+                    # Requeue the neighbours of moved nodes that are not in their new community
+                    for v in moved:
+                        neighbors = G.neighbors(v)
+                        active[neighbors[P.membership[neighbors] != P.community_of(v)]] = True
+                else:
+                    active[:] = True
+            if observer is not None:
+                observer.on_pass({
+                    "pass": passes, "moves": len(moved), "gain": gain,
+                    "queue": 0 if stop else int(active.sum()), "seconds": time.perf_counter() - started,
+                })
+            if stop:
+                break
+            current += gain
+    finally:
+        arrays = None
+        shared.close()
+    return P
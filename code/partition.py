@@ -0,0 +1,208 @@
+import numpy as np
+
+
+class Partition:
+    """
+    A partition of the nodes of a CSRGraph, stored as a node -> community membership vector.
+
+    There is one community slot per node plus one spare, so an empty community to move a node into
+    always exists. Looking up and moving a node are O(1).
+
+    Attributes:
+        graph (CSRGraph): The partitioned graph.
+        membership (np.ndarray): int32 community id of every node.
+        community_counts (np.ndarray): Number of nodes in every community slot.
+        community_sizes (np.ndarray): Summed node weights of every community slot, the size used by CPM.
+        community_weights (np.ndarray): Summed weighted degree of every community slot, as used by modularity.
+    """
+
+    def __init__(self, G, membership=None):
+        """
+        Initializes a new Partition.
+
+        Args:
+            G (CSRGraph): The graph to partition.
+            membership (array-like, optional): Community id of every node. Defaults to singletons.
+        """
+        n = len(G)
+        self.graph = G
+        if membership is None:
+            membership = np.arange(n, dtype=np.int32)
+        self.membership = np.array(membership, dtype=np.int32)
+
+        n_slots = max(n, int(self.membership.max(initial=-1)) + 1) + 1
+        self.community_counts = np.bincount(self.membership, minlength=n_slots)
+        self.community_sizes = np.bincount(self.membership, weights=G.node_weights, minlength=n_slots)
+        self.community_weights = np.bincount(self.membership, weights=G.strengths, minlength=n_slots)
+        self._n_communities = int(np.count_nonzero(self.community_counts))
+        self._empty = np.flatnonzero(self.community_counts == 0)[::-1].tolist()
+
+    @classmethod
+    def singleton(cls, G):
+        """
+        Create a partition where each node is in its own community.
+
+        Args:
+            G (CSRGraph): The graph that will be partitioned.
+
+        Returns:
+            Partition: The singleton partition.
+        """
+        return cls(G)
+
+    @classmethod
+    def from_sets(cls, G, P):
+        """
+        Converts a set-of-frozensets partition of node ids. Nodes not covered by P get singleton communities.
+
+        Args:
+            G (CSRGraph): The partitioned graph.
+            P (iterable): The communities, each an iterable of node ids.
+
+        Returns:
+            Partition: The same partition.
+        """
+        membership = np.full(len(G), -1, dtype=np.int64)
+        c = 0
+        for comm in P:
+            if comm:
+                membership[list(comm)] = c
+                c += 1
+        missing = membership < 0
+        membership[missing] = np.arange(c, c + np.count_nonzero(missing))
+        return cls(G, membership)
+
+    def __len__(self):
+        """
+        Returns:
+            int: The number of non-empty communities.
+        """
+        return self._n_communities
+
+    def __repr__(self):
+        return f"Partition(n={len(self.membership)}, communities={len(self)})"
+
+    def copy(self):
+        P = Partition.__new__(Partition)
+        P.graph = self.graph
+        P.membership = self.membership.copy()
+        P.community_counts = self.community_counts.copy()
+        P.community_sizes = self.community_sizes.copy()
+        P.community_weights = self.community_weights.copy()
+        P._n_communities = self._n_communities
+        P._empty = list(self._empty)
+        return P
+
+    def community_of(self, v):
+        return self.membership[v]
+
+    def community_ids(self):
+        """
+        Returns:
+            np.ndarray: The ids of the non-empty communities.
+        """
+        return np.flatnonzero(self.community_counts)
+
+    def neighbor_community_weights(self, v):
+        """
+        Sums the weights of the edges of v per neighbouring community, in one sweep over its row.
+
+        Args:
+            v (int): A node id.
+
+        Returns:
+            tuple: (weight_to, self_loop), a dict of community id -> edge weight between v and the other
+                nodes of that community, and the weight of the self-loop of v.
+        """
+        weight_to = {}
+        self_loop = 0.0
+        for u, w in zip(self.graph.neighbors(v).tolist(), self.graph.neighbor_weights(v).tolist()):
+            if u == v:
+                self_loop += w
+            else:
+                c = self.membership[u]
+                weight_to[c] = weight_to.get(c, 0.0) + w
+        return weight_to, self_loop
+
+    def get_empty_community(self):
+        """
+        Returns:
+            int: The id of a community with no nodes in it.
+        """
+        while self.community_counts[self._empty[-1]]:
+            self._empty.pop()
+        return self._empty[-1]
+
+    def move_node(self, v, community):
+        """
+        Moves node v to the given community, updating the community tables in place.
+
+        Args:
+            v (int): The node to move.
+            community (int): The id of the target community, possibly empty.
+        """
+        old = self.membership[v]
+        if old == community:
+            return
+        size = self.graph.node_weights[v]
+        strength = self.graph.strengths[v]
+        self.community_counts[old] -= 1
+        self.community_sizes[old] -= size
+        self.community_weights[old] -= strength
+        if self.community_counts[old] == 0:
+            self._n_communities -= 1
+            self._empty.append(old)
+        if self.community_counts[community] == 0:
+            self._n_communities += 1
+            if self._empty and self._empty[-1] == community:
+                self._empty.pop()
+        self.community_counts[community] += 1
+        self.community_sizes[community] += size
+        self.community_weights[community] += strength
+        self.membership[v] = community
+
+    def add_nodes(self):
+        """
+        Puts the nodes that were added to the graph since the partition was made, see CSRGraph.update_edges,
+        into new singleton communities.
+        """
+        n_old = len(self.membership)
+        added = len(self.graph) - n_old
+        if added <= 0:
+            return
+        slots = len(self.community_counts)
+        self.membership = np.concatenate([self.membership, np.arange(slots, slots + added, dtype=np.int32)])
+        self.community_counts = np.concatenate([self.community_counts, np.ones(added, dtype=self.community_counts.dtype)])
+        self.community_sizes = np.concatenate([self.community_sizes, self.graph.node_weights[n_old:]])
+        self.community_weights = np.concatenate([self.community_weights, self.graph.strengths[n_old:]])
+        self._n_communities += added
+
+    def update_strengths(self, nodes, deltas):
+        """
+        Adds the changes in weighted degree of the given nodes to the totals of their communities, after
+        edges of the graph changed.
+
+        Args:
+            nodes (np.ndarray): Node ids, possibly repeated.
+            deltas (np.ndarray): The change in strength of every entry of nodes.
+        """
+        np.add.at(self.community_weights, self.membership[nodes], deltas)
+
+    def renumbered(self):
+        """
+        Returns:
+            np.ndarray: The membership with community ids renumbered to 0..len(self) - 1.
+        """
+        _, membership = np.unique(self.membership, return_inverse=True)
+        return membership.astype(np.int32)
+
+    def to_sets(self):
+        """
+        Converts to the set-of-frozensets form used by draw_partitioned_graph and flattened.
+
+        Returns:
+            set of frozensets: The communities, each a frozenset of node ids.
+        """
+        order = np.argsort(self.membership, kind="stable")
+        bounds = np.flatnonzero(np.diff(self.membership[order])) + 1
+        return {frozenset(comm.tolist()) for comm in np.split(order, bounds) if len(comm)}
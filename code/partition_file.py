@@ -0,0 +1,55 @@
+import numpy as np
+
+from partition import Partition
+
+# Partition file: an uncompressed .npz holding the int32 community id of every node, the label of every node
+# and the CSRGraph.checksum of the graph the partition was made for.
+
+
+def write_partition(path, G, membership):
+    """
+    Saves a partition of G, e.g. the result of a run, to warm-start a later run with read_partition.
+
+    Args:
+        path (str): The file to write. np.savez adds .npz unless it is there already.
+        G (CSRGraph): The partitioned graph.
+        membership (np.ndarray or Partition): Community id of every node of G.
+    """
+    if isinstance(membership, Partition):
+        membership = membership.membership
+    membership = np.asarray(membership, dtype=np.int32)
+    if len(membership) != len(G):
+        raise ValueError(f"membership has {len(membership)} entries for {len(G)} nodes")
+    labels = np.arange(len(G)) if isinstance(G.labels, range) else np.array(list(G.labels))
+    if labels.dtype == object:
+        labels = labels.astype(str)
+    np.savez(path, membership=membership, labels=labels, checksum=np.array(G.checksum()))
+
+
+def read_partition(path, G):
+    """
+    Loads a partition file as a partition of G.
+
+    When G is the graph the file was written for, the membership is used as it is. Otherwise the nodes are
+    matched by label: nodes of G the file has a community for keep it, and the other nodes of G become
+    singletons.
+
+    Args:
+        path (str): The partition file.
+        G (CSRGraph): The graph to partition.
+
+    Returns:
+        Partition: The partition of G.
+    """
+    with np.load(path) as f:
+        membership, labels, checksum = f["membership"], f["labels"], str(f["checksum"])
+    if len(membership) == len(G) and checksum == G.checksum():
+        return Partition(G, membership)
+
+    index = {label: c for label, c in zip(labels.tolist(), membership.tolist())}
+    names = G.labels if labels.dtype.kind != "U" else [str(label) for label in G.labels]
+    matched = np.array([index.get(label, -1) for label in names], dtype=np.int64)
+    unknown = matched < 0
+    # Unknown nodes get singleton ids past those in the file
+    matched[unknown] = int(membership.max(initial=-1)) + 1 + np.arange(np.count_nonzero(unknown))
+    return Partition(G, matched)
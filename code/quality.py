@@ -0,0 +1,366 @@
+import numpy as np
+
+
+def community_tables(G, membership, node_totals, n_communities):
+    """
+    Builds the per-community tables used to score moves incrementally.
+
+    Args:
+        G (CSRGraph): The graph.
+        membership (np.ndarray): Community id of every node.
+        node_totals (np.ndarray): What each node contributes to its community's total, i.e. its size
+            for CPM or its weighted degree for modularity.
+        n_communities (int): Length of the tables, at least membership.max() + 1.
+
+    Returns:
+        tuple: (totals, internal), the summed node totals and the internal edge weight of every community.
+    """
+    internal = np.zeros(n_communities)
+    for sources, targets, weights in G.edge_chunks():
+        community = membership[sources]
+        same = community == membership[targets]
+        # Edges between different nodes appear twice in the CSR rows, self-loops once
+        w = np.where(sources == targets, 2 * weights, weights)
+        internal += np.bincount(community[same], weights=w[same], minlength=n_communities)
+    internal /= 2
+    totals = np.bincount(membership, weights=node_totals, minlength=n_communities)
+    return totals, internal
+
+
+def cpm_move_gain(weight_to_new, weight_to_old, node_size, new_size, old_size, gamma):
+    """
+    Change in the CPM quality H when a node leaves its community for another one.
+
+    Args:
+        weight_to_new (float): Edge weight between the node and the target community.
+        weight_to_old (float): Edge weight between the node and the rest of its current community.
+        node_size (float): Size of the node.
+        new_size (float): Size of the target community.
+        old_size (float): Size of the current community without the node.
+        gamma (float): The resolution parameter.
+
+    Returns:
+        float: H after the move minus H before it.
+    """
+    return (weight_to_new - weight_to_old) - gamma * node_size * (new_size - old_size)
+
+
+def modularity_move_gain(weight_to_new, weight_to_old, node_degree, new_degree, old_degree, m, gamma=1):
+    """
+    Change in modularity when a node leaves its community for another one.
+
+    Args:
+        weight_to_new (float): Edge weight between the node and the target community.
+        weight_to_old (float): Edge weight between the node and the rest of its current community.
+        node_degree (float): Weighted degree of the node.
+        new_degree (float): Summed weighted degree of the target community.
+        old_degree (float): Summed weighted degree of the current community without the node.
+        m (float): Total edge weight of the graph.
+        gamma (float): The resolution parameter.
+
+    Returns:
+        float: Modularity after the move minus modularity before it.
+    """
+    return ((weight_to_new - weight_to_old) - gamma * node_degree * (new_degree - old_degree) / (2 * m)) / m
+
+
+def cpm_quality(totals, internal, gamma):
+    """
+    Evaluates H from the community tables, as the internal edge weight of each community
+    minus gamma times the number of node pairs it contains.
+
+    Args:
+        totals (np.ndarray): Size of every community.
+        internal (np.ndarray): Internal edge weight of every community.
+        gamma (float): The resolution parameter.
+
+    Returns:
+        float: The CPM quality.
+    """
+    return float(internal.sum() - gamma * (totals * (totals - 1) / 2).sum())
+
+
+def modularity_quality(totals, internal, m, gamma=1):
+    """
+    Evaluates modularity from the community tables.
+
+    Args:
+        totals (np.ndarray): Summed weighted degree of every community.
+        internal (np.ndarray): Internal edge weight of every community.
+        m (float): Total edge weight of the graph.
+        gamma (float): The resolution parameter.
+
+    Returns:
+        float: The modularity.
+    """
+    return float(internal.sum() / m - gamma * ((totals / (2 * m)) ** 2).sum())
+
+
+def membership_from_communities(G, communities):
+    """
+    Turns a partition given as communities of node labels into a membership vector.
+
+    Args:
+        G (CSRGraph): The graph, whose labels name the nodes.
+        communities (iterable): The communities, each an iterable of node labels. Nodes in none of them
+            become singleton communities.
+
+    Returns:
+        np.ndarray: int64 community id of every node.
+    """
+    index = {label: i for i, label in enumerate(G.labels)}
+    membership = np.full(len(G), -1, dtype=np.int64)
+    n_communities = 0
+    for C in communities:
+        membership[[index[v] for v in C]] = n_communities
+        n_communities += 1
+    uncovered = membership < 0
+    membership[uncovered] = n_communities + np.arange(np.count_nonzero(uncovered))
+    return membership
+
+
+def partition_modularity(G, membership, gamma=1):
+    """
+    Evaluates the modularity of a partition in one pass over the edge arrays.
+
+    Args:
+        G (CSRGraph): The graph.
+        membership (np.ndarray): Non-negative community id of every node.
+        gamma (float): The resolution parameter.
+
+    Returns:
+        float: The modularity.
+    """
+    return Modularity(G.total_weight, gamma)(G, membership)
+
+
+def partition_cpm(G, membership, gamma):
+    """
+    Evaluates the CPM quality H of a partition in one pass over the edge arrays.
+
+    Args:
+        G (CSRGraph): The graph.
+        membership (np.ndarray): Non-negative community id of every node.
+        gamma (float): The resolution parameter.
+
+    Returns:
+        float: The CPM quality.
+    """
+    return CPM(gamma)(G, membership)
+
+
+class Quality:
+    """
+    A partition quality of the form sum over communities of internal edge weight minus a null model term
+    that only depends on a per-community total, such as the community's size or summed degree.
+
+    Every quality is evaluated from two accumulators per community, its total and its internal weight,
+    which makes the gain of moving one node an O(1) expression once the node's edge weight to the
+    communities involved is known. The graph-level constants a quality needs, like the total edge weight,
+    are unchanged by aggregate(), so one instance serves every level of Louvain or Leiden.
+
+    Attributes:
+        gamma (float): The resolution parameter.
+        uses_strengths (bool): Whether community totals sum the weighted degrees of the nodes rather than
+            their sizes.
+    """
+
+    uses_strengths = False
+
+    def __init__(self, gamma):
+        self.gamma = gamma
+
+    def __repr__(self):
+        return f"{type(self).__name__}(gamma={self.gamma})"
+
+    def node_totals(self, G):
+        """
+        Returns:
+            np.ndarray: What every node of G adds to its community's total.
+        """
+        return G.strengths if self.uses_strengths else G.node_weights
+
+    def community_totals(self, P):
+        """
+        Returns:
+            np.ndarray: The total of every community of the Partition P, kept up to date by P.move_node.
+        """
+        return P.community_weights if self.uses_strengths else P.community_sizes
+
+    def null_weight(self, total_a, total_b):
+        """
+        The edge weight the null model expects between two disjoint sets of nodes, scaled by gamma.
+
+        Args:
+            total_a (float): Total of the first set.
+            total_b (float): Total of the second set.
+
+        Returns:
+            float: The expected weight.
+        """
+        raise NotImplementedError
+
+    def move_gain(self, weight_to_new, weight_to_old, node_total, new_total, old_total):
+        """
+        Change in quality when a node leaves its community for another one.
+
+        Args:
+            weight_to_new (float): Edge weight between the node and the target community.
+            weight_to_old (float): Edge weight between the node and the rest of its current community.
+            node_total (float): Total of the node.
+            new_total (float): Total of the target community.
+            old_total (float): Total of the current community without the node.
+
+        Returns:
+            float: The quality after the move minus the quality before it.
+        """
+        return (weight_to_new - weight_to_old) - self.null_weight(node_total, new_total - old_total)
+
+    def from_tables(self, totals, internal):
+        """
+        Evaluates the quality from the community tables built by community_tables.
+
+        Args:
+            totals (np.ndarray): Total of every community.
+            internal (np.ndarray): Internal edge weight of every community.
+
+        Returns:
+            float: The quality.
+        """
+        raise NotImplementedError
+
+    def __call__(self, G, membership):
+        """
+        Evaluates the quality of a partition in one pass over the edges.
+
+        Args:
+            G (CSRGraph): The graph.
+            membership (np.ndarray): Non-negative community id of every node.
+
+        Returns:
+            float: The quality.
+        """
+        membership = np.asarray(membership, dtype=np.int64)
+        totals, internal = community_tables(G, membership, self.node_totals(G), int(membership.max(initial=-1)) + 1)
+        return self.from_tables(totals, internal)
+
+    def aggregate(self, G, membership, n_communities=None):
+        """
+        Collapses every community into one node such that the quality of the partition equals the quality
+        of the singleton partition of the result. Internal weight becomes a self-loop, which keeps both the
+        weighted degrees and the total edge weight, and node sizes are summed.
+
+        Args:
+            G (CSRGraph): The graph.
+            membership (np.ndarray): Community id of every node, in 0..n_communities - 1.
+            n_communities (int, optional): Number of communities.
+
+        Returns:
+            CSRGraph: The aggregate graph.
+        """
+        return G.aggregate(membership, n_communities)
+
+
+class CPM(Quality):
+    """
+    The Constant Potts Model H, internal weight minus gamma times the number of node pairs in every community.
+    """
+
+    def null_weight(self, total_a, total_b):
+        return self.gamma * total_a * total_b
+
+    def from_tables(self, totals, internal):
+        return cpm_quality(totals, internal, self.gamma)
+
+
+class Modularity(Quality):
+    """
+    Newman-Girvan modularity with a resolution parameter, normalised by the total edge weight m.
+    """
+
+    uses_strengths = True
+
+    def __init__(self, m, gamma=1):
+        """
+        Args:
+            m (float): Total edge weight of the graph.
+            gamma (float): The resolution parameter.
+        """
+        super().__init__(gamma)
+        self.m = m
+
+    def null_weight(self, total_a, total_b):
+        return self.gamma * total_a * total_b / (2 * self.m)
+
+    def move_gain(self, weight_to_new, weight_to_old, node_total, new_total, old_total):
+        return modularity_move_gain(weight_to_new, weight_to_old, node_total, new_total, old_total, self.m, self.gamma)
+
+    def from_tables(self, totals, internal):
+        if self.m == 0:
+            return 0.0
+        return modularity_quality(totals, internal, self.m, self.gamma)
+
+
+class ReichardtBornholdt(Quality):
+    """
+    The Reichardt-Bornholdt Potts model, internal weight minus gamma times the weight a null model expects
+    inside every community. With the configuration null model this is m times modularity; with the
+    Erdos-Renyi null model every node pair is expected to carry the graph's density p = m / (n (n - 1) / 2),
+    making it CPM with resolution gamma * p.
+    """
+
+    def __init__(self, m, n, gamma=1, null_model="configuration"):
+        """
+        Args:
+            m (float): Total edge weight of the graph.
+            n (float): Number of nodes of the original graph, i.e. the summed node sizes.
+            gamma (float): The resolution parameter.
+            null_model (str): "configuration" or "erdos_renyi".
+        """
+        if null_model not in ("configuration", "erdos_renyi"):
+            raise ValueError(f"unknown null model {null_model!r}")
+        super().__init__(gamma)
+        self.m = m
+        self.null_model = null_model
+        self.uses_strengths = null_model == "configuration"
+        self.density = m / (n * (n - 1) / 2) if n > 1 else 0.0
+
+    def __repr__(self):
+        return f"ReichardtBornholdt(gamma={self.gamma}, null_model={self.null_model!r})"
+
+    def null_weight(self, total_a, total_b):
+        if self.uses_strengths:
+            return self.gamma * total_a * total_b / (2 * self.m)
+        return self.gamma * self.density * total_a * total_b
+
+    def from_tables(self, totals, internal):
+        if self.uses_strengths:
+            if self.m == 0:
+                return float(internal.sum())
+            return float(internal.sum() - self.gamma * (totals ** 2).sum() / (4 * self.m))
+        return cpm_quality(totals, internal, self.gamma * self.density)
+
+
+def make_quality(G, quality="cpm", gamma=None, null_model="configuration"):
+    """
+    Builds a quality for a graph by name.
+
+    Args:
+        G (CSRGraph): The graph the quality will be optimised on.
+        quality (str or Quality): "cpm", "modularity" or "rb" for Reichardt-Bornholdt. A Quality is returned
+            as is.
+        gamma (float, optional): The resolution parameter. Defaults to 1/7 for CPM and 1 otherwise.
+        null_model (str): The null model of Reichardt-Bornholdt, "configuration" or "erdos_renyi".
+
+    Returns:
+        Quality: The quality.
+    """
+    if isinstance(quality, Quality):
+        return quality
+    if quality == "cpm":
+        return CPM(1/7 if gamma is None else gamma)
+    if quality == "modularity":
+        return Modularity(G.total_weight, 1 if gamma is None else gamma)
+    if quality == "rb":
+        return ReichardtBornholdt(G.total_weight, float(G.node_weights.sum()), 1 if gamma is None else gamma, null_model)
+    raise ValueError(f"unknown quality {quality!r}")
@@ -0,0 +1,335 @@
+"""
+Draws partitions to image files, headlessly, for graphs from a few dozen nodes to millions.
+
+The layout is computed in two steps. The communities are laid out first, as the nodes of the aggregate graph,
+with a force-directed layout whose repulsion is taken against a random sample of nodes, so that an iteration
+costs O(m + n * sample) instead of O(n^2). Every node then starts inside a disc around its community, sized
+by the community. Graphs of up to RASTER_NODES nodes are then laid out by the same force-directed layout
+from those positions, with the edges between communities weakened, which spreads the nodes of a community
+apart without mixing the communities; larger ones are only pulled towards
+their neighbours in the community for a few O(m) smoothing steps. The positions of the most recently drawn
+graphs are cached, so drawing the same graph again, e.g. after every level of a run, reuses them.
+
+Small graphs are drawn with matplotlib, with one collection for all edges. Large ones are rasterised with
+NumPy: edges are sampled into a pixel density image in chunks and the nodes are painted on top in their
+community colours.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from csr_graph import CSRGraph
+from quality import membership_from_communities
+
+# Graphs with more nodes than this are rasterised rather than drawn with matplotlib
+RASTER_NODES = 2000
+
+
+def as_membership(G, P):
+    """
+    Reads a partition in any of the forms used in the repo as a membership vector.
+
+    Args:
+        G (CSRGraph): The graph.
+        P (array-like, dict or iterable): A community id per node id, a dict from node label to community,
+            or the communities as iterables of node labels.
+
+    Returns:
+        np.ndarray: int64 community id of every node, numbered 0..c - 1.
+    """
+    if isinstance(P, np.ndarray):
+        membership = P
+    elif isinstance(P, dict):
+        membership = [P[label] for label in G.labels]
+    else:
+        membership = membership_from_communities(G, P)
+    _, membership = np.unique(np.asarray(membership), return_inverse=True)
+    return membership.astype(np.int64)
+
+
+def community_colors(membership):
+    """
+    Gives every community a colour, spreading the hues of consecutive ids by the golden ratio so that
+    neighbouring ids are far apart.
+
+    Args:
+        membership (np.ndarray): Community id of every node, numbered 0..c - 1.
+
+    Returns:
+        np.ndarray: (n, 3) float RGB colour of every node.
+    """
+    from matplotlib.colors import hsv_to_rgb
+
+    c = int(membership.max(initial=-1)) + 1
+    ids = np.arange(c)
+    hsv = np.stack([(ids * 0.618033988749895) % 1.0, 0.55 + 0.35 * (ids % 3) / 2, np.full(c, 0.85)], axis=1)
+    return hsv_to_rgb(hsv)[membership]
+
+
+def force_layout(G, pos=None, iterations=50, sample=512, seed=0, temperature=0.1):
+    """
+    Fruchterman-Reingold layout in the unit square. Nodes repel each other in proportion to their node
+    weights and edges attract in proportion to their weights. The repulsion on every node is estimated from
+    the same random sample of nodes, drawn anew every iteration, and is exact when G has at most sample nodes.
+
+    Args:
+        G (CSRGraph): The graph.
+        pos (np.ndarray, optional): (n, 2) starting positions. Defaults to random ones.
+        iterations (int): Number of iterations, over which the step size cools linearly.
+        sample (int): Number of nodes the repulsion is taken against.
+        seed (int): Seed of the starting positions and the samples.
+        temperature (float): Largest step of a node in the first iteration. Smaller values keep nodes near
+            their starting positions.
+
+    Returns:
+        np.ndarray: (n, 2) float64 positions in [0, 1]^2.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(G)
+    pos = rng.random((n, 2)) if pos is None else np.array(pos, dtype=np.float64)
+    if n < 2:
+        return np.full((n, 2), 0.5)
+    mass = G.node_weights / G.node_weights.mean()
+    rows = np.repeat(np.arange(n), np.diff(G.indptr))
+    k = 1 / np.sqrt(n)
+    block = max(1, (1 << 22) // min(n, sample))
+    for t in np.linspace(temperature, 0.0, iterations, endpoint=False):
+        others = np.arange(n) if n <= sample else rng.choice(n, sample, replace=False)
+        scale = n / len(others)
+        displacement = np.zeros((n, 2))
+        for lo in range(0, n, block):
+            delta = pos[lo:lo + block, None, :] - pos[None, others, :]
+            distance2 = np.maximum((delta ** 2).sum(axis=2), 1e-9)
+            displacement[lo:lo + block] = scale * k * k * (delta * (mass[others] / distance2)[:, :, None]).sum(axis=1)
+        delta = pos[rows] - pos[G.indices]
+        distance = np.sqrt((delta ** 2).sum(axis=1))
+        attraction = delta * (G.weights * distance / k)[:, None]
+        displacement[:, 0] -= np.bincount(rows, weights=attraction[:, 0], minlength=n)
+        displacement[:, 1] -= np.bincount(rows, weights=attraction[:, 1], minlength=n)
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=1)), 1e-9)
+        pos += displacement * (np.minimum(length, t) / length)[:, None]
+    return _fit(pos)
+
+
+def _fit(pos):
+    """
+    Scales and shifts positions into [0, 1]^2, keeping their aspect ratio and centring the shorter side.
+    """
+    if not len(pos):
+        return pos
+    low, high = pos.min(axis=0), pos.max(axis=0)
+    extent = max((high - low).max(), 1e-9)
+    return (pos - (low + high) / 2) / extent + 0.5
+
+
+def community_layout(G, membership, iterations=50, smoothing=10, seed=0):
+    """
+    Lays G out community by community: the communities by force_layout on the aggregate graph, then every
+    node in a disc around its community. Graphs of up to RASTER_NODES nodes are then laid out by force_layout
+    from those positions, with the edges between communities weakened; the nodes of larger ones are smoothed towards their neighbours in the community.
+
+    Args:
+        G (CSRGraph): The graph.
+        membership (np.ndarray): Community id of every node, numbered 0..c - 1.
+        iterations (int): Iterations of force_layout on the aggregate graph, and on G when it is small.
+        smoothing (int): For graphs of more than RASTER_NODES nodes, steps that move every node halfway to
+            the mean of its neighbours in its community, after which every community is scaled back to the
+            spread of its disc.
+        seed (int): Seed of the layout.
+
+    Returns:
+        np.ndarray: (n, 2) float64 positions in [0, 1]^2.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(G)
+    c = int(membership.max(initial=-1)) + 1
+    centres = force_layout(G.aggregate(membership, c), iterations=iterations, seed=seed)
+    sizes = np.bincount(membership, minlength=c)
+    radius = (0.5 / np.sqrt(max(c, 1))) * np.sqrt(sizes / sizes.mean())
+    angle = rng.random(n) * 2 * np.pi
+    offset = radius[membership] * np.sqrt(rng.random(n))
+    pos = centres[membership] + np.stack([np.cos(angle), np.sin(angle)], axis=1) * offset[:, None]
+    rows = np.repeat(np.arange(n), np.diff(G.indptr))
+    inside = membership[rows] == membership[G.indices]
+    if n <= RASTER_NODES:
+        # Edges between communities pull with a tenth of their weight, and steps no longer than a typical
+        # disc keep the nodes near their community while they spread out
+        weights = np.where(inside, G.weights, G.weights / 10)
+        layout_graph = CSRGraph(G.indptr, G.indices, weights, G.node_weights)
+        return force_layout(layout_graph, pos=pos, iterations=iterations, seed=seed, temperature=float(radius.mean()))
+
+    rows, columns, weights = rows[inside], G.indices[inside], G.weights[inside]
+    strengths = np.bincount(rows, weights=weights, minlength=n)
+    has_neighbors = strengths > 0
+    # A uniform disc of radius r has a root mean square distance of r / sqrt(2) from its centre
+    spread = radius / np.sqrt(2)
+    for _ in range(smoothing):
+        mean = np.stack([np.bincount(rows, weights=weights * pos[columns, axis], minlength=n)
+                         for axis in range(2)], axis=1)
+        pos[has_neighbors] = (pos[has_neighbors] + mean[has_neighbors] / strengths[has_neighbors, None]) / 2
+        # Smoothing shrinks every community towards its mean; move it back and restore its spread
+        for axis in range(2):
+            pos[:, axis] -= (np.bincount(membership, weights=pos[:, axis], minlength=c) / sizes)[membership]
+        rms = np.sqrt(np.bincount(membership, weights=(pos ** 2).sum(axis=1), minlength=c) / sizes)
+        pos = centres[membership] + pos * (spread / np.maximum(rms, 1e-12))[membership, None]
+    return _fit(pos)
+
+
+class LayoutCache:
+    """
+    Node positions per graph, computed by community_layout the first time a graph is drawn and reused after.
+    Only the layouts of the max_entries most recently drawn graphs are kept.
+
+    Graphs are told apart by CSRGraph.checksum, so converting the same networkx graph again still hits the
+    cache.
+    """
+
+    def __init__(self, max_entries=8):
+        """
+        Initializes a new, empty LayoutCache.
+
+        Args:
+            max_entries (int): Number of layouts kept; the least recently used one is dropped first.
+        """
+        self.max_entries = max_entries
+        self._positions = OrderedDict()
+
+    def positions(self, G, membership, refresh=False):
+        """
+        Args:
+            G (CSRGraph): The graph.
+            membership (np.ndarray): Community id of every node, which seeds the layout when it is computed.
+            refresh (bool): Compute the layout again, from this membership.
+
+        Returns:
+            np.ndarray: (n, 2) positions in [0, 1]^2.
+        """
+        key = G.checksum()
+        if refresh or key not in self._positions:
+            self._positions[key] = community_layout(G, membership)
+        self._positions.move_to_end(key)
+        while len(self._positions) > self.max_entries:
+            self._positions.popitem(last=False)
+        return self._positions[key]
+
+    def clear(self):
+        """
+        Forgets every cached layout.
+        """
+        self._positions.clear()
+
+
+_layouts = LayoutCache()
+
+
+def rasterize(G, pos, colors, size=2048, node_size=2, budget=1 << 25, seed=0):
+    """
+    Draws G into an RGB image with NumPy. Every edge adds darkness along the pixels it crosses, sampled
+    about once per pixel of its length, and the nodes are painted over the edges as small squares. The
+    samples are made in blocks of bounded size. When all edges together would take more than budget samples,
+    a random share of them is drawn with their weights scaled up to match, which keeps the expected density.
+
+    Args:
+        G (CSRGraph): The graph.
+        pos (np.ndarray): (n, 2) positions in [0, 1]^2.
+        colors (np.ndarray): (n, 3) RGB colour of every node.
+        size (int): Width and height of the image in pixels.
+        node_size (int): Side of the square of every node in pixels.
+        budget (int): Most edge samples to make.
+        seed (int): Seed of the choice of edges when over budget.
+
+    Returns:
+        np.ndarray: (size, size, 3) float RGB image in [0, 1].
+    """
+    margin = node_size + 1
+    pixels = np.rint(margin + pos * (size - 1 - 2 * margin)).astype(np.int64)
+
+    def steps_of(sources, targets):
+        return np.maximum(np.abs(pixels[targets] - pixels[sources]).max(axis=1), 1)
+
+    total = sum(int(steps_of(sources, targets)[sources < targets].sum()) for sources, targets, _ in G.edge_chunks())
+    share = min(1.0, budget / max(total, 1))
+    rng = np.random.default_rng(seed)
+    density = np.zeros(size * size)
+    block = 1 << 22
+    for sources, targets, weights in G.edge_chunks(1 << 18):
+        keep = sources < targets
+        if share < 1:
+            keep &= rng.random(len(sources)) < share
+        sources, targets, weights = sources[keep], targets[keep], weights[keep] / share
+        steps = steps_of(sources, targets)
+        ends = np.cumsum(steps + 1)
+        lo = 0
+        while lo < len(steps):
+            # Edges lo..hi - 1 take at most block samples, or one edge if it alone takes more
+            hi = max(int(np.searchsorted(ends, (ends[lo - 1] if lo else 0) + block, side="right")), lo + 1)
+            counts = steps[lo:hi] + 1
+            edge = np.repeat(np.arange(lo, hi), counts)
+            t = (np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)) / steps[edge]
+            start, end = pixels[sources[edge]], pixels[targets[edge]]
+            points = np.rint(start + (end - start) * t[:, None]).astype(np.int64)
+            density += np.bincount(points[:, 1] * size + points[:, 0], weights=weights[edge], minlength=size * size)
+            lo = hi
+    density = np.log1p(density.reshape(size, size))
+    shade = 1 - 0.85 * density / max(density.max(), 1e-12)
+    image = np.repeat(shade[:, :, None], 3, axis=2)
+    for dy in range(node_size):
+        for dx in range(node_size):
+            image[pixels[:, 1] - node_size // 2 + dy, pixels[:, 0] - node_size // 2 + dx] = colors
+    # Rows grow downwards in an image, y upwards in a layout
+    return image[::-1]
+
+
+def draw_partition(G, P, path="partition.png", raster=None, size=None, cache=None, refresh=False):
+    """
+    Draws a partition of G to an image file. Nothing is shown on screen.
+
+    Args:
+        G (CSRGraph or nx.Graph): The graph.
+        P (array-like, dict or iterable): The partition, in any form as_membership reads.
+        path (str): The file to write; its extension picks the format.
+        raster (bool, optional): Rasterise with NumPy instead of drawing with matplotlib. Defaults to
+            rasterising graphs of more than RASTER_NODES nodes.
+        size (int, optional): Image width and height in pixels. Defaults to 800 for drawings and 2048 for
+            raster images.
+        cache (LayoutCache, optional): Where positions are cached. Defaults to one shared by all calls.
+        refresh (bool): Compute the layout again instead of reusing a cached one.
+
+    Returns:
+        str: path.
+    """
+    if not isinstance(G, CSRGraph):
+        G = CSRGraph.from_networkx(G)
+    membership = as_membership(G, P)
+    pos = (_layouts if cache is None else cache).positions(G, membership, refresh)
+    colors = community_colors(membership)
+    if raster is None:
+        raster = len(G) > RASTER_NODES
+
+    if raster:
+        from matplotlib.image import imsave
+
+        imsave(path, np.rint(rasterize(G, pos, colors, size or 2048) * 255).astype(np.uint8))
+        return path
+
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+
+    size = size or 800
+    figure = Figure(figsize=(size / 100, size / 100), dpi=100)
+    axes = figure.add_axes((0, 0, 1, 1))
+    axes.set_axis_off()
+    segments = np.concatenate([
+        np.stack([pos[sources[sources < targets]], pos[targets[sources < targets]]], axis=1)
+        for sources, targets, _ in G.edge_chunks()
+    ] or [np.zeros((0, 2, 2))])
+    axes.add_collection(LineCollection(segments, colors="0.6", linewidths=0.5, zorder=1))
+    axes.scatter(pos[:, 0], pos[:, 1], s=max(4, 20000 / max(len(G), 1)) if len(G) > 100 else 120, c=colors,
+                 edgecolors="none", zorder=2)
+    if len(G) <= 100:
+        for label, (x, y) in zip(G.labels, pos):
+            axes.annotate(str(label), (x, y), ha="center", va="center", fontsize=7, zorder=3)
+    axes.set_xlim(-0.05, 1.05)
+    axes.set_ylim(-0.05, 1.05)
+    figure.savefig(path)
+    return path
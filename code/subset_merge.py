@@ -0,0 +1,81 @@
+def node_total(G, v, quality):
+    """
+    Returns:
+        float: What node v of the networkx graph G adds to its community's total under quality, its weighted
+            degree or its size 1.
+    """
+    return G.degree(v, weight="weight") if quality.uses_strengths else 1
+
+
+def merge_subset(G, S, quality, rng, sampler, gamma=0.5, theta=0.1):
+    """
+    Merges the well-connected nodes of a subset of a networkx graph into refined communities, starting from
+    singletons, MergeNodesSubset in the paper. This is the refinement of the Leiden variants that keep a
+    partition as node sets, leiden_muya and leiden_miles.
+
+    Each node's links into the subset are counted in one pass over its edges, and each refined community
+    keeps its cut to the rest of the subset and its degree up to date as nodes join it, so refining a subset
+    costs O(edges of its nodes) rather than rescanning every community. The well-connected nodes are visited
+    in a random order.
+
+    Args:
+        G (Graph): The graph.
+        S (iterable): The nodes of one community of the unrefined partition.
+        quality (Quality): The quality the merges gain in.
+        rng (np.random.Generator): Source of the visiting order and of the random choices.
+        sampler (MergeSampler): Buffers for the choices.
+        gamma (float): The resolution of the well-connectedness checks.
+        theta (float): The randomness of the choices.
+
+    Returns:
+        list: The refined communities of S, each a list of nodes.
+    """
+    S = list(S)
+    S_nodes = set(S)
+    # Calculate the degree of each node and the subset
+    k = {v: len(G[v]) for v in S}
+    k_S = sum(k.values())
+    k_in = {v: sum(1 for u in G[v] if u in S_nodes and u != v) for v in S}
+
+    # Consider only nodes that are well connected within the subset, in random order
+    R = [v for v in S if k_in[v] >= gamma * k[v] * (k_S - k[v])]
+    rng.shuffle(R)
+
+    # The refined communities of S by id, starting from singletons, with their cut to the rest of S,
+    # their degree and their total under quality
+    community_of = {v: i for i, v in enumerate(S)}
+    members = {i: [v] for v, i in community_of.items()}
+    cut = {i: k_in[v] for v, i in community_of.items()}
+    degree = {i: k[v] for v, i in community_of.items()}
+    total = {i: node_total(G, v, quality) for v, i in community_of.items()}
+
+    for v in R:
+        current = community_of[v]
+        # Consider only nodes that are in singleton communities
+        if len(members[current]) == 1:
+            links = {}
+            weight_to = {}
+            for u, data in G[v].items():
+                if u in S_nodes and u != v:
+                    C = community_of[u]
+                    links[C] = links.get(C, 0) + 1
+                    weight_to[C] = weight_to.get(C, 0) + data.get("weight", 1)
+
+            # Choose a random community to move the node to, based on a probability proportional to the change
+            # in partition quality. Consider only well-connected communities; of those, only the ones v links to can gain
+            sampler.clear()
+            sampler.add(current, 0)
+            for C in links:
+                if cut[C] >= gamma * degree[C] * (k_S - degree[C]):
+                    sampler.add(C, quality.move_gain(weight_to[C], 0, total[current], total[C], 0))
+            chosen_community = sampler.sample(theta, rng)
+            if chosen_community != current:
+                # Move v into the chosen community
+                members[chosen_community].append(v)
+                cut[chosen_community] += k_in[v] - 2 * links[chosen_community]
+                degree[chosen_community] += k[v]
+                total[chosen_community] += total[current]
+                community_of[v] = chosen_community
+                del members[current]
+
+    return list(members.values())
@@ -0,0 +1,225 @@
+"""
+Sweeps the resolution parameter gamma of the Leiden algorithm (leiden2) over a list or range of values.
+
+Every gamma is one Leiden run, and the runs are spread over a process pool which maps the graph from one
+shared memory block, or straight from a graph file, instead of each loading its own copy. With warm starts, each worker runs a contiguous
+stretch of the sorted gammas and starts every run from the partition found for the previous one, which
+usually converges in less time than starting from singletons.
+
+Usage:
+    python sweep.py --graph stackoverflow --quality modularity --range 0.25 4 16 --log --workers 4 --warm-start
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from csr_graph import CSRGraph
+from parallel_moving import process_pool, share_graph, worker_graph
+from partition import Partition
+from quality import make_quality, partition_modularity
+
+
+def gamma_grid(start, stop, num, log=False):
+    """
+    Evenly spaced resolutions, including both ends.
+
+    Args:
+        start (float): The first gamma.
+        stop (float): The last gamma.
+        num (int): Number of values.
+        log (bool): Space the values evenly on a log scale instead, for sweeps over orders of magnitude.
+
+    Returns:
+        np.ndarray: The gammas.
+    """
+    if log:
+        return np.geomspace(start, stop, num)
+    return np.linspace(start, stop, num)
+
+
+def normalized_mutual_information(a, b):
+    """
+    The normalised mutual information 2 I(a; b) / (H(a) + H(b)) of two partitions of the same nodes, 1 when
+    they are the same up to renumbering.
+
+    Args:
+        a (np.ndarray): Community id of every node.
+        b (np.ndarray): Community id of every node.
+
+    Returns:
+        float: The NMI, between 0 and 1.
+    """
+    n = len(a)
+    if n == 0:
+        return 1.0
+    _, a = np.unique(a, return_inverse=True)
+    _, b = np.unique(b, return_inverse=True)
+    _, joint = np.unique(a.astype(np.int64) * (b.max() + 1) + b, return_counts=True)
+    p_a = np.bincount(a) / n
+    p_b = np.bincount(b) / n
+    p_ab = joint / n
+    h_a = -np.sum(p_a * np.log(p_a))
+    h_b = -np.sum(p_b * np.log(p_b))
+    h_ab = -np.sum(p_ab * np.log(p_ab))
+    if h_a + h_b == 0:
+        return 1.0
+    return float(2 * (h_a + h_b - h_ab) / (h_a + h_b))
+
+
+def run_gammas(G, gammas, quality="cpm", null_model="configuration", warm_start=False, seed=0):
+    """
+    Runs Leiden once per gamma, one after the other.
+
+    Args:
+        G (CSRGraph or tuple): The graph, or the SharedArrays.spec of the graph shared by share_graph.
+        gammas (list): The resolutions, in the order to run them.
+        quality (str): The quality to optimise, see make_quality.
+        null_model (str): The null model of the Reichardt-Bornholdt quality.
+        warm_start (bool): Start every run but the first from the partition of the previous gamma.
+        seed (int): Seed of the refinement of every run.
+
+    Returns:
+        list of dict: One record per gamma, see sweep.
+    """
+    from leiden2 import run_leiden
+
+    if not isinstance(G, CSRGraph):
+        G = worker_graph(G)
+    records = []
+    membership = None
+    for gamma in gammas:
+        q = make_quality(G, quality, gamma, null_model)
+        P = Partition(G, membership) if warm_start and membership is not None else Partition.singleton(G)
+        start = time.perf_counter()
+        _, hierarchy, levels = run_leiden(G, P, q, np.random.default_rng(seed))
+        membership = hierarchy.resolve()
+        records.append({
+            "gamma": float(gamma),
+            "quality": float(q(G, membership)),
+            "modularity": float(partition_modularity(G, membership)),
+            "communities": int(membership.max(initial=-1)) + 1,
+            "levels": levels,
+            "wall_time": time.perf_counter() - start,
+            "membership": membership,
+        })
+    return records
+
+
+def sweep(G, gammas, quality="cpm", null_model="configuration", workers=1, warm_start=False, seed=0, shared=None):
+    """
+    Runs Leiden for every gamma and compares the results.
+
+    Without warm starts every run starts from singletons with the same seed, so the results do not depend on
+    the number of workers. With warm starts they do, since each worker starts a new chain of warm starts.
+
+    Args:
+        G (CSRGraph): The graph.
+        gammas (iterable): The resolutions to try.
+        quality (str): The quality to optimise, see make_quality.
+        null_model (str): The null model of the Reichardt-Bornholdt quality.
+        workers (int): Number of processes; 1 runs everything in this process.
+        warm_start (bool): Start runs from the partition of the next smaller gamma run by the same worker.
+        seed (int): Seed of the refinement of every run.
+        shared (SharedArrays, optional): G as already shared by share_graph, so that the processes of several
+            calls map one copy; it stays open. By default G is shared for this call only, and a graph
+            memory-mapped from a file is mapped by the processes rather than copied.
+
+    Returns:
+        list of dict: One record per gamma in increasing order, with the gamma, the quality optimised at that
+            gamma, the modularity (gamma = 1) for comparison across gammas, the number of communities, the
+            number of levels run_leiden ran, the wall_time in seconds, the membership of every node, and its stability, the
+            mean normalised mutual information between this membership and those of the neighbouring gammas.
+    """
+    gammas = np.sort(np.asarray(list(gammas), dtype=np.float64))
+    workers = max(1, min(workers, len(gammas)))
+    if workers == 1:
+        records = run_gammas(G, gammas, quality, null_model, warm_start, seed)
+    else:
+        # With warm starts, each worker takes a contiguous stretch so that its runs can follow each other
+        chunks = np.array_split(gammas, workers) if warm_start else [[gamma] for gamma in gammas]
+        owned = shared is None
+        if owned:
+            shared = share_graph(G)
+        pool = process_pool(workers)
+        try:
+            results = pool.starmap(run_gammas, [
+                (shared.spec, chunk, quality, null_model, warm_start, seed) for chunk in chunks
+            ])
+        finally:
+            pool.terminate()
+            pool.join()
+            if owned:
+                shared.close()
+        records = [record for result in results for record in result]
+
+    for i, record in enumerate(records):
+        neighbors = records[max(i - 1, 0):i] + records[i + 1:i + 2]
+        record["stability"] = float(np.mean([
+            normalized_mutual_information(record["membership"], other["membership"]) for other in neighbors
+        ])) if neighbors else None
+    return records
+
+
+def load_graph(name):
+    """
+    Reads the graph to sweep.
+
+    Args:
+        name (str): An edge list .csv with source, target and value columns, a graph file written by
+            graph_file.write_graph, or a graph name understood by benchmark.load_graph.
+
+    Returns:
+        CSRGraph: The graph.
+    """
+    if name.endswith(".csv"):
+        from edge_ingest import read_edge_csv
+
+        return read_edge_csv(name)
+    if os.path.isfile(name):
+        from graph_file import open_graph
+
+        return open_graph(name)
+    import benchmark
+
+    return benchmark.load_graph(name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep the resolution of the Leiden algorithm.")
+    parser.add_argument("--graph", default="karate",
+                        help="an edge list .csv, a graph file, or karate, stackoverflow or synthetic-N")
+    gammas = parser.add_mutually_exclusive_group(required=True)
+    gammas.add_argument("--gammas", nargs="+", type=float, help="the resolutions to try")
+    gammas.add_argument("--range", nargs=3, metavar=("START", "STOP", "NUM"), help="NUM resolutions from START to STOP")
+    parser.add_argument("--log", action="store_true", help="space the --range values on a log scale")
+    parser.add_argument("--quality", default="cpm", choices=["cpm", "modularity", "rb"])
+    parser.add_argument("--null-model", default="configuration", choices=["configuration", "erdos_renyi"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--warm-start", action="store_true", help="start each gamma from the previous one's partition")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="where to write the results as JSON, without the memberships")
+    args = parser.parse_args(argv)
+
+    if args.gammas is not None:
+        values = args.gammas
+    else:
+        values = gamma_grid(float(args.range[0]), float(args.range[1]), int(args.range[2]), args.log)
+    G = load_graph(args.graph)
+    records = sweep(G, values, args.quality, args.null_model, args.workers, args.warm_start, args.seed)
+
+    for record in records:
+        record.pop("membership")
+        stability = "-" if record["stability"] is None else f"{record['stability']:.3f}"
+        print(f"gamma={record['gamma']:<10.4g} quality={record['quality']:<12.6g} "
+              f"modularity={record['modularity']:.4f} communities={record['communities']:<6} "
+              f"levels={record['levels']:<3} stability={stability} time={record['wall_time']:.3f}s", flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()